@@ -2,18 +2,34 @@
 
 import sys
 import os
+import uuid
 
+# src modules import each other top-level, so load them the same way to get one copy of each
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), 'src')))
 
-import pandas as pd
 import streamlit as st
 import time
 
-from src.img_pro import ImageProcessor
-from src.processing_time import ProcessingTimeTracker
-from src.image_captioning import ImageCaptioningSystem
-from src.excel_processor import ExcelProcessor
-from src.session_manager import SessionManager
+from image_cache import ImageHandleCache
+from http_cache import DiskImageCache
+from processing_time import ProcessingTimeTracker
+from image_captioning import ImageCaptioningSystem
+from excel_processor import ExcelProcessor
+from session_manager import SessionManager
+from batch_jobs import BatchJobManager
+from deadline import Deadline, DeadlineExceeded
+from analysis_plan import AnalysisPlan, DEPTH_LEVELS
+from exporters import EXPORT_FORMATS
+from scheduler import BATCH, INTERACTIVE
+from speculation import SpeculativeAnalyzer
+
+EXPORT_FORMAT_LABELS = {'xlsx': "Excel", 'parquet': "Parquet", 'csv': "CSV", 'jsonl': "JSONL"}
+# Seconds between refreshes of the batch job panel
+BATCH_REFRESH_SECONDS = 2
+# Time budget for a single-image analysis and for each of its stages
+SINGLE_IMAGE_TIMEOUT = 120
+SINGLE_IMAGE_STAGE_TIMEOUT = 60
+FOCUS_OPTIONS = ["🎨 Colors", "📦 Objects", "📝 Text", "😊 Emotions", "🎬 Activities"]
 
 def create_animated_header(text, animation_duration=2):
     return f"""
@@ -44,6 +60,182 @@ def initialize_session_manager():
         st.session_state.session_manager = SessionManager()
     return st.session_state.session_manager
 
+@st.cache_resource(show_spinner=False)
+def load_http_cache():
+    # One on-disk download cache for the whole process
+    return DiskImageCache()
+
+@st.cache_resource(show_spinner=False)
+def load_captioning_system(gemini_key1, gemini_key2):
+    # Shared across reruns and sessions so the async clients and key pool are reused
+    return ImageCaptioningSystem(gemini_key1, gemini_key2, http_cache=load_http_cache())
+
+@st.cache_resource(show_spinner=False)
+def load_speculator(gemini_key1, gemini_key2):
+    # Keyed by image digest, so a result started for one rerun is found by the next
+    return SpeculativeAnalyzer(
+        load_captioning_system(gemini_key1, gemini_key2),
+        timeout=SINGLE_IMAGE_TIMEOUT,
+        stage_timeout=SINGLE_IMAGE_STAGE_TIMEOUT
+    )
+
+@st.cache_resource(show_spinner=False)
+def load_batch_jobs():
+    # Lives outside any script run so jobs survive reruns and page changes
+    return BatchJobManager()
+
+def initialize_image_cache():
+    if 'image_cache' not in st.session_state:
+        st.session_state.image_cache = ImageHandleCache(http_cache=load_http_cache())
+    return st.session_state.image_cache
+
+def get_batch_owner():
+    # The job manager is shared by every session; jobs are only visible to their owners.
+    # The owner id lives in the URL so a reload or a bookmarked link finds its jobs again.
+    owner = st.query_params.get('owner') or st.session_state.get('batch_owner') or str(uuid.uuid4())
+    st.session_state.batch_owner = owner
+    if st.query_params.get('owner') != owner:
+        st.query_params['owner'] = owner
+    return owner
+
+def render_job_attach(job_manager, owner):
+    # Lets a new session or another browser pick up a job by the id shown with it
+    with st.expander("🔗 Reattach a batch job"):
+        job_id = st.text_input("Job ID", key="attach_job_id")
+        if st.button("Reattach", key="attach_job") and job_id:
+            if job_manager.attach(job_id, owner):
+                st.success("✅ Job reattached")
+            else:
+                st.error("❌ No job with that ID; it may have finished and been cleared")
+
+def render_batch_jobs(job_manager, scheduler, owner):
+    render_job_attach(job_manager, owner)
+    jobs = job_manager.list_jobs(owner)
+    if not jobs:
+        return
+    
+    st.markdown("### 🗂️ Batch Jobs")
+    active_ids = [job['job_id'] for job in jobs if job['status'] in ('queued', 'running')]
+    # Only running jobs are polled; finished ones render once per full rerun
+    if active_ids:
+        render_active_jobs(job_manager, scheduler, owner, active_ids)
+    for job in jobs:
+        if job['job_id'] not in active_ids:
+            render_finished_job(job)
+
+@st.fragment(run_every=BATCH_REFRESH_SECONDS)
+def render_active_jobs(job_manager, scheduler, owner, active_ids):
+    jobs = [job for job in job_manager.list_jobs(owner) if job['status'] in ('queued', 'running')]
+    if [job['job_id'] for job in jobs] != active_ids:
+        # A job finished; rerun the page so it moves to the finished list and polling stops when idle
+        st.rerun()
+    
+    # Batch rows queue behind interactive requests, so show how long each class waits
+    queue_stats = scheduler.metrics()
+    queue_cols = st.columns(2)
+    for col, (label, name) in zip(queue_cols, [("Interactive", INTERACTIVE), ("Batch", BATCH)]):
+        col.metric(
+            f"{label} Queue",
+            queue_stats[name]['queue_depth'],
+            delta=f"p95 wait {queue_stats[name]['wait_p95']:.2f}s, {queue_stats[name]['running']} running",
+            delta_color="off"
+        )
+    
+    for job in jobs:
+        finished = job['finished']
+        total = max(job['total'], 1)
+        label = "Waiting in queue" if job['status'] == 'queued' else f"Processing {finished}/{job['total']}"
+        st.markdown(f"""
+            <div style='
+                background: linear-gradient(45deg, #FF6B6B, #4ECDC4);
+                padding: 1rem;
+                border-radius: 10px;
+                text-align: center;
+                color: white;
+                margin: 0.5rem 0;
+            '>
+                {job['name']}: {label}
+            </div>
+        """, unsafe_allow_html=True)
+        st.progress(finished / total)
+        st.caption(f"Job ID: {job['job_id']}")
+        
+        remaining = (job['total'] - finished) * job['avg_time']
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Processed", f"{finished}/{job['total']}")
+        col2.metric("Avg Time", f"{job['avg_time']:.1f}s")
+        col3.metric("Remaining", f"{remaining:.1f}s")
+        
+        if st.button("🛑 Cancel", key=f"cancel_{job['job_id']}", use_container_width=True):
+            job_manager.cancel(job['job_id'], owner)
+        
+        if job['errors']:
+            with st.expander(f"⚠️ {job['failed']} images failed, {job['timed_out']} timed out"):
+                for content_id, error in job['errors']:
+                    st.warning(f"⚠️ Error processing {content_id}: {error}")
+
+def render_finished_job(job):
+    finished = job['finished']
+    total = max(job['total'], 1)
+    
+    if job['status'] in ('completed', 'cancelled') and job['output_file']:
+        if job['status'] == 'completed':
+            title = f"✨ {job['name']}: Processing Complete! ✨"
+        else:
+            title = f"🛑 {job['name']}: Cancelled, partial results saved"
+        st.markdown(f"""
+            <div style='
+                background: linear-gradient(45deg, #96E6B3, #4ECDC4);
+                padding: 1.5rem;
+                border-radius: 10px;
+                text-align: center;
+            '>
+                <h3 style='color: white; margin: 0;'>
+                    {title}
+                </h3>
+                <p style='color: white; margin: 0.5rem 0;'>
+                    Processed {finished} images in {job['elapsed']:.1f}s
+                    <br>
+                    Average processing time: {job['avg_time']:.1f}s per image
+                </p>
+            </div>
+        """, unsafe_allow_html=True)
+        
+        col1, col2, col3 = st.columns(3)
+        col1.metric(
+            "Total Processed",
+            f"{finished}/{job['total']}",
+            f"{job['timed_out']} timed out" if job['timed_out'] else job['status'].title()
+        )
+        col2.metric("Total Time", f"{job['elapsed']:.1f}s", f"Avg: {job['avg_time']:.1f}s/image")
+        col3.metric(
+            "Success Rate",
+            f"{(job['processed']/total*100):.1f}%",
+            f"{job['processed']}/{job['total']} images"
+        )
+        
+        with open(job['output_file'], 'rb') as f:
+            st.download_button(
+                f"📥 Download {EXPORT_FORMAT_LABELS[job['export_format']]}",
+                f,
+                file_name=os.path.basename(job['output_file']),
+                mime=EXPORT_FORMATS[job['export_format']]['mime'],
+                key=f"download_{job['job_id']}",
+                use_container_width=True,
+            )
+        st.caption(f"Job ID: {job['job_id']}")
+    
+    elif job['status'] == 'cancelled':
+        st.warning(f"🛑 {job['name']}: Cancelled before it started")
+    
+    else:
+        st.error(f"💥 {job['name']}: Error saving results: {job['error']}")
+    
+    if job['errors']:
+        with st.expander(f"⚠️ {job['failed']} images failed, {job['timed_out']} timed out"):
+            for content_id, error in job['errors']:
+                st.warning(f"⚠️ Error processing {content_id}: {error}")
+
 def main():
     time_tracker = ProcessingTimeTracker()
     st.set_page_config(
@@ -111,6 +303,22 @@ def main():
                 st.metric("Response Time", "1.8s", delta="-0.2s")
             with perf_cols[1]:
                 st.metric("Memory Usage", "85%", delta="5%")
+            cache_stats = load_http_cache().stats()
+            cache_cols = st.columns(2)
+            with cache_cols[0]:
+                st.metric(
+                    "Download Cache Hits",
+                    f"{cache_stats['hit_ratio'] * 100:.0f}%",
+                    delta=f"{cache_stats['hits'] + cache_stats['revalidated']}/{cache_stats['requests']} requests",
+                    delta_color="off"
+                )
+            with cache_cols[1]:
+                st.metric(
+                    "Bytes Saved",
+                    f"{cache_stats['bytes_saved'] / (1024 * 1024):.1f} MB",
+                    delta=f"{cache_stats['revalidated']} revalidated",
+                    delta_color="off"
+                )
 
         st.markdown("### ⚡ Quick Actions")
         if st.button("🔄 Reset System", type="secondary", use_container_width=True):
@@ -131,7 +339,7 @@ def main():
         try:
             if not captioning_system:
                 with st.spinner("🚀 Initializing AI systems..."):
-                    captioning_system = ImageCaptioningSystem(gemini_key1, gemini_key2)
+                    captioning_system = load_captioning_system(gemini_key1, gemini_key2)
                     time.sleep(0.5)
                     st.success("✨ System ready!")
         except Exception as e:
@@ -242,155 +450,57 @@ def main():
                         margin: 1rem 0;
                     '>
                 """, unsafe_allow_html=True)
+                batch_cols = st.columns(2)
+                with batch_cols[0]:
+                    batch_depth = st.select_slider(
+                        "Analysis Depth",
+                        options=DEPTH_LEVELS,
+                        value="Detailed",
+                        key="batch_depth",
+                        help="Basic makes one short-description call per image; deeper levels add stages."
+                    )
+                with batch_cols[1]:
+                    batch_focus = st.multiselect(
+                        "Analysis Focus",
+                        FOCUS_OPTIONS,
+                        default=[],
+                        key="batch_focus",
+                        help="Trims the detailed analysis to the selected areas."
+                    )
+                pack_size = st.slider(
+                    "Images per request",
+                    min_value=1,
+                    max_value=8,
+                    value=1,
+                    help="Pack several images into one model request. Higher values trade latency for throughput."
+                )
+                export_format = st.selectbox(
+                    "Output Format",
+                    list(EXPORT_FORMATS),
+                    format_func=lambda fmt: EXPORT_FORMAT_LABELS[fmt],
+                    help="Excel suits client deliverables; Parquet, CSV and JSONL are much faster for large sheets."
+                )
                 col1, col2, col3 = st.columns([1,2,1])
                 with col2:
                     if st.button("🔮 Process All URLs", type="primary", use_container_width=True):
-                        results = []
-                        progress_bar = st.progress(0)
-                        
-                        # Create placeholder for status card
-                        status_card = st.empty()
-                        
-                        # Create placeholder for metrics
-                        metrics_container = st.empty()
-                        
-                        batch_start = time.time()
-                        total_items = len(df)
-                        
-                        for idx, row in df.iterrows():
-                            progress = (idx + 1) / total_items
-                            progress_bar.progress(progress)
-                            
-                            # Update status card
-                            status_card.markdown(f"""
-                                <div style='
-                                    background: linear-gradient(45deg, #FF6B6B, #4ECDC4);
-                                    padding: 1rem;
-                                    border-radius: 10px;
-                                    text-align: center;
-                                    color: white;
-                                    margin: 0.5rem 0;
-                                '>
-                                    Processing {idx + 1}/{total_items}: {row['content_id']}
-                                </div>
-                            """, unsafe_allow_html=True)
-                            
-                            try:
-                                item_start = time.time()
-                                components = captioning_system.process_image(row['URL'])
-                                duration = time.time() - item_start
-                                
-                                components['content_id'] = row['content_id']
-                                components['processing_time'] = duration
-                                results.append(components)
-                                
-                                # Calculate metrics
-                                elapsed_time = time.time() - batch_start
-                                items_processed = idx + 1
-                                avg_time = elapsed_time / items_processed
-                                est_remaining = (total_items - items_processed) * avg_time
-                                
-                                # Update metrics in place using columns inside the placeholder
-                                metrics_container.columns([1, 1, 1])[0].metric(
-                                    "Processed",
-                                    f"{items_processed}/{total_items}",
-                                    f"+{1}" if items_processed > 1 else None
-                                )
-                                metrics_container.columns([1, 1, 1])[1].metric(
-                                    "Avg Time",
-                                    f"{avg_time:.1f}s",
-                                    f"{(avg_time - (elapsed_time/(items_processed-1) if items_processed > 1 else 0)):.1f}s" if items_processed > 1 else None
-                                )
-                                metrics_container.columns([1, 1, 1])[2].metric(
-                                    "Remaining",
-                                    f"{est_remaining:.1f}s",
-                                    f"-{(est_remaining - (est_remaining * (items_processed-1)/items_processed if items_processed > 1 else 0)):.1f}s" if items_processed > 1 else None
-                                )
-                                
-                            except Exception as e:
-                                st.warning(f"⚠️ Error processing {row['content_id']}: {str(e)}")
-                                continue
-                        
-                        # Clear progress indicators
-                        progress_bar.empty()
-                        
-                        # Show final summary
-                        total_time = time.time() - batch_start
-                        status_card.markdown(f"""
-                            <div style='
-                                background: linear-gradient(45deg, #96E6B3, #4ECDC4);
-                                padding: 1.5rem;
-                                border-radius: 10px;
-                                text-align: center;
-                                animation: pulseSuccess 2s infinite;
-                            '>
-                                <h2 style='color: white; margin: 0;'>
-                                    ✨ Processing Complete! ✨
-                                </h2>
-                                <p style='color: white; margin: 0.5rem 0;'>
-                                    Processed {total_items} images in {total_time:.1f}s
-                                    <br>
-                                    Average processing time: {(total_time/total_items):.1f}s per image
-                                </p>
-                            </div>
-                            <style>
-                                @keyframes pulseSuccess {{
-                                    0% {{ transform: scale(1); }}
-                                    50% {{ transform: scale(1.02); }}
-                                    100% {{ transform: scale(1); }}
-                                }}
-                            </style>
-                        """, unsafe_allow_html=True)
-                        
-                        # Clear the metrics and show final summary metrics
-                        metrics_container.columns([1, 1, 1])[0].metric(
-                            "Total Processed",
-                            f"{total_items}/{total_items}",
-                            "Completed"
-                        )
-                        metrics_container.columns([1, 1, 1])[1].metric(
-                            "Total Time",
-                            f"{total_time:.1f}s",
-                            f"Avg: {(total_time/total_items):.1f}s/image"
+                        # Jobs run on a background executor so reruns and navigation don't stop them
+                        job_id = load_batch_jobs().submit(
+                            captioning_system,
+                            df,
+                            os.path.splitext(excel_file.name)[0],
+                            export_format=export_format,
+                            pack_size=pack_size,
+                            plan=AnalysisPlan.from_settings(batch_depth, batch_focus),
+                            owner=get_batch_owner()
                         )
-                        metrics_container.columns([1, 1, 1])[2].metric(
-                            "Success Rate",
-                            f"{(len(results)/total_items*100):.1f}%",
-                            f"{len(results)}/{total_items} images"
-                        )
-                        
-                        # Export section
-                        try:
-                            output_file = excel_processor.save_results(
-                                df, 
-                                results,
-                                os.path.splitext(excel_file.name)[0]
-                            )
-                            
-                            with open(output_file, 'rb') as f:
-                                col1, col2 = st.columns(2)
-                                with col1:
-                                    st.download_button(
-                                        "📥 Download Excel",
-                                        f,
-                                        file_name=os.path.basename(output_file),
-                                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                                        use_container_width=True,
-                                    )
-                                with col2:
-                                    if st.button("📊 View Summary", use_container_width=True):
-                                        st.dataframe(
-                                            pd.DataFrame(results),
-                                            use_container_width=True
-                                        )
-                                
-                        except Exception as e:
-                            st.error(f"💥 Error saving results: {str(e)}")
+                        st.success(f"🚀 Queued {len(df)} images for processing (job ID {job_id})")
                 
                 st.markdown("</div>", unsafe_allow_html=True)
                         
             except Exception as e:
                 st.error(f"💥 Error loading file: {str(e)}")
+        
+        render_batch_jobs(load_batch_jobs(), captioning_system.scheduler, get_batch_owner())
 
     # Main Image Processing Section
     st.markdown("### 🎯 Single Image Analysis")
@@ -418,11 +528,12 @@ def main():
             
             with col1:
                 st.markdown("### 🖼️ Preview")
-                if isinstance(image_input, str):
-                    image = ImageProcessor.load_image_from_url(image_input)
-                else:
-                    image = ImageProcessor.load_image_from_file(image_input)
-                st.image(image, use_container_width=True)
+                # Decoded once per session and shared with the analysis below
+                image_cache = initialize_image_cache()
+                image_handle = image_cache.get(
+                    image_input, Deadline(SINGLE_IMAGE_TIMEOUT, SINGLE_IMAGE_STAGE_TIMEOUT)
+                )
+                st.image(image_handle.thumbnail(), use_container_width=True)
 
             with col2:
                 st.markdown("### 🎯 Analysis Settings")
@@ -430,27 +541,40 @@ def main():
                 with st.expander("⚙️ Configuration", expanded=True):
                     depth = st.select_slider(
                         "Analysis Depth",
-                        options=["Basic", "Standard", "Detailed", "Advanced", "Expert"],
+                        options=DEPTH_LEVELS,
                         value="Standard"
                     )
                     
                     focus = st.multiselect(
                         "Analysis Focus",
-                        ["🎨 Colors", "📦 Objects", "📝 Text", "😊 Emotions", "🎬 Activities"],
+                        FOCUS_OPTIONS,
                         default=["🎨 Colors", "📦 Objects"]
                     )
+                    
+                    speculative = st.toggle(
+                        "⚡ Speculative Analysis",
+                        value=False,
+                        help="Start analyzing as soon as the preview loads so results are ready on click. Uses quota for images you may not analyze."
+                    )
                 
-                if st.button("✨ Analyze Image", type="primary", use_container_width=True):
-                    with st.spinner("🔮 Processing image..."):
-                        progress = st.progress(0)
-                        start_time = time_tracker.start_operation()
-                        components = captioning_system.process_image(image_input)
-                        duration = time_tracker.end_operation(start_time, 'single' if not isinstance(image_input, str) else 'url')
-                        
-                        st.markdown("### ⏱️ Processing Metrics")
-                        time_tracker.display_metrics('single' if not isinstance(image_input, str) else 'url')
-                        st.info(f"Current processing time: {duration:.2f} seconds")
-                        progress.empty()
+                plan = AnalysisPlan.from_settings(depth, focus)
+                speculator = load_speculator(gemini_key1, gemini_key2)
+                # Button state is known before the widget renders; the click rerun must not
+                # start a speculation, or the click itself would run as backfill
+                clicked_at = time.monotonic()
+                analyze_clicked = st.session_state.get('analyze_image', False)
+                if speculative:
+                    if not analyze_clicked:
+                        speculator.speculate(image_handle.key, image_handle.image, plan)
+                    spec_stats = speculator.stats()
+                    st.caption(
+                        f"Speculation hit rate {spec_stats['hit_rate'] * 100:.0f}% "
+                        f"({spec_stats['used']}/{spec_stats['started']} used, "
+                        f"{spec_stats['skipped']} skipped)"
+                    )
+                
+                if st.button("✨ Analyze Image", type="primary", use_container_width=True, key='analyze_image'):
+                    category = 'single' if not isinstance(image_input, str) else 'url'
                     
                     tab1, tab2, tab3 = st.tabs([
                         "📝 Summary",
@@ -458,13 +582,51 @@ def main():
                         "⚙️ Technical"
                     ])
                     
+                    # Placeholders are filled progressively as each stage streams in
                     with tab1:
-                        st.success(components['base_description'])
+                        summary_placeholder = st.empty()
+                        final_summary_placeholder = st.empty()
                     with tab2:
-                        st.info(components['detailed_analysis'])
+                        analysis_placeholder = st.empty()
+                    renderers = {
+                        'base_description': summary_placeholder.success,
+                        'detailed_analysis': analysis_placeholder.info,
+                        'final_summary': final_summary_placeholder.success,
+                    }
+                    
+                    with st.spinner("🔮 Processing image..."):
+                        components = {}
+                        first_text_time = None
+                        start_time = time_tracker.start_operation()
+                        deadline = Deadline(SINGLE_IMAGE_TIMEOUT, SINGLE_IMAGE_STAGE_TIMEOUT)
+                        # A finished or running speculation is used as is; otherwise stream from scratch
+                        speculated = (speculator.claim(image_handle.key, plan, deadline, clicked_at)
+                                      if speculative else None)
+                        if speculated is not None:
+                            first_text_time = time_tracker.record_first_text(start_time, category)
+                            components = dict(speculated)
+                            for key, render in renderers.items():
+                                if components.get(key):
+                                    render(components[key])
+                        else:
+                            for key, chunk in captioning_system.stream_image(image_input, image_cache, plan, deadline):
+                                if first_text_time is None:
+                                    first_text_time = time_tracker.record_first_text(start_time, category)
+                                components[key] = components.get(key, '') + chunk
+                                if key in renderers:
+                                    renderers[key](components[key])
+                        duration = time_tracker.end_operation(start_time, category)
+                    
                     with tab3:
                         st.json(components.get('technical_details', {}))
                     
+                    st.markdown("### ⏱️ Processing Metrics")
+                    time_tracker.display_metrics(category)
+                    if first_text_time is not None:
+                        st.info(f"Current processing time: {duration:.2f} seconds (first text after {first_text_time:.2f} seconds)")
+                    else:
+                        st.info(f"Current processing time: {duration:.2f} seconds")
+                    
                     st.markdown("### 📥 Export Results")
                     col1, col2 = st.columns(2)
                     with col1:
@@ -482,6 +644,8 @@ def main():
                     
                     st.balloons()
                     
+        except DeadlineExceeded:
+            st.error(f"⏱️ Analysis timed out after {SINGLE_IMAGE_TIMEOUT} seconds, please try again")
         except Exception as e:
             st.error(f"💥 Processing error: {str(e)}")
 
@@ -0,0 +1,82 @@
+# export_formats.py
+# Benchmark export time and file size for each supported output format, both for
+# writing a ready-made frame and for the full batch export through save_results,
+# which also joins the results to the input sheet.
+#
+#   python benchmarks/export_formats.py --rows 100000
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+import pandas as pd
+
+from excel_processor import ExcelProcessor
+from exporters import EXPORT_FORMATS, chunk_dataframe, export_chunks
+
+
+def build_results(rows: int) -> pd.DataFrame:
+    """Build a sheet shaped like the batch output with realistic text lengths"""
+    description = "A person in a red jacket walks a dog along a tree-lined street. " * 3
+    analysis = "1. Subject Analysis (People, Objects, Actions): " + "detail " * 150
+    return pd.DataFrame({
+        'original order': [str(i) for i in range(rows)],
+        'content_id': [f"item-{i}" for i in range(rows)],
+        'URL': [f"https://example.com/images/{i}.jpg" for i in range(rows)],
+        'Base_Description': [description] * rows,
+        'Subject Analysis (People, Objects, Actions)': [analysis] * rows,
+        'Environment and Setting': [''] * rows,
+        'Technical Aspects': [''] * rows,
+        'Final_Summary': [description] * rows,
+    })
+
+
+def build_input(results: pd.DataFrame) -> pd.DataFrame:
+    """The input sheet the results were produced from"""
+    return results[['original order', 'content_id', 'URL']]
+
+
+def iter_results(results: pd.DataFrame):
+    """Yield results the way a batch spool does, one dict per row"""
+    for content_id, base, analysis, summary in results[[
+            'content_id', 'Base_Description',
+            'Subject Analysis (People, Objects, Actions)', 'Final_Summary']].itertuples(index=False):
+        yield {'content_id': content_id, 'base_description': base,
+               'detailed_analysis': analysis, 'final_summary': summary}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark export formats")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--chunksize', type=int, default=10000)
+    parser.add_argument('--formats', nargs='+', default=list(EXPORT_FORMATS))
+    args = parser.parse_args()
+
+    df = build_results(args.rows)
+    input_df = build_input(df)
+    print(f"{'format':<10}{'write (s)':>12}{'full export (s)':>18}{'size (MB)':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt in args.formats:
+            path = os.path.join(tmp, f"results{EXPORT_FORMATS[fmt]['extension']}")
+            start = time.perf_counter()
+            try:
+                export_chunks(chunk_dataframe(df, args.chunksize), path, fmt)
+            except ImportError as e:
+                print(f"{fmt:<10}{'skipped':>12}  ({e})")
+                continue
+            write_elapsed = time.perf_counter() - start
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+
+            start = time.perf_counter()
+            ExcelProcessor().save_results(input_df, iter_results(df), os.path.join(tmp, "batch"),
+                                          fmt, args.chunksize)
+            full_elapsed = time.perf_counter() - start
+            print(f"{fmt:<10}{write_elapsed:>12.2f}{full_elapsed:>18.2f}{size_mb:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from typing import Iterable, Optional, Tuple
+
+# Depth levels offered by the UI, from cheapest to most thorough
+DEPTH_LEVELS = ["Basic", "Standard", "Detailed", "Advanced", "Expert"]
+
+# Sections of the detailed analysis prompt, in the order they are asked for
+CORE_SECTIONS = ("subject", "environment", "technical")
+ALL_SECTIONS = CORE_SECTIONS + ("text", "emotions")
+
+# Detailed analysis sections needed to cover each focus area
+FOCUS_SECTIONS = {
+    "colors": ("environment", "technical"),
+    "objects": ("subject",),
+    "text": ("text",),
+    "emotions": ("subject", "emotions"),
+    "activities": ("subject",),
+}
+
+
+class AnalysisPlan:
+    """Execution plan describing which chain stages run and what they cover.
+
+    Built from the "Analysis Depth" and "Analysis Focus" settings:
+
+    - Basic: a single short-description call
+    - Standard: description and a detailed analysis trimmed to the focus areas
+    - Detailed: Standard plus the final summary
+    - Advanced: Detailed with the core sections always included
+    - Expert: Detailed with every section, whatever the focus
+    """
+
+    def __init__(self, stages: Tuple[str, ...], sections: Tuple[str, ...] = CORE_SECTIONS,
+                 short: bool = False):
+        self.stages = tuple(stages)
+        self.sections = tuple(sections)
+        self.short = short
+
+    @classmethod
+    def full(cls) -> "AnalysisPlan":
+        """The plan matching the original three-stage chain"""
+        return cls(("base_description", "detailed_analysis", "final_summary"))
+
+    @staticmethod
+    def _normalize_focus(label: str) -> str:
+        """Map a UI label such as "🎨 Colors" to its focus key"""
+        return label.split()[-1].lower() if label.strip() else ""
+
+    @classmethod
+    def from_settings(cls, depth: str = "Detailed",
+                      focus: Optional[Iterable[str]] = None) -> "AnalysisPlan":
+        """Build the plan for a depth level and a list of focus labels"""
+        if depth not in DEPTH_LEVELS:
+            raise ValueError(f"Unknown analysis depth: {depth}")
+
+        if depth == "Basic":
+            return cls(("base_description",), sections=(), short=True)
+
+        focused = set()
+        for label in focus or []:
+            focused.update(FOCUS_SECTIONS.get(cls._normalize_focus(label), ()))
+
+        if depth == "Expert":
+            wanted = set(ALL_SECTIONS)
+        elif depth == "Advanced":
+            wanted = set(CORE_SECTIONS) | focused
+        else:
+            wanted = focused or set(CORE_SECTIONS)
+        sections = tuple(section for section in ALL_SECTIONS if section in wanted)
+
+        stages = ("base_description", "detailed_analysis")
+        if depth != "Standard":
+            stages += ("final_summary",)
+        return cls(stages, sections=sections)
+
+    @property
+    def cache_key(self) -> str:
+        """Stable string identifying the plan, for keying cached results"""
+        return f"{','.join(self.stages)}|{','.join(self.sections)}|{int(self.short)}"
+
+    def __repr__(self) -> str:
+        return f"AnalysisPlan(stages={self.stages}, sections={self.sections}, short={self.short})"
@@ -0,0 +1,190 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from analysis_plan import AnalysisPlan
+from batch_pipeline import BatchPipeline, ResultSpool
+from excel_processor import ExcelProcessor
+from deadline import CancellationToken
+
+
+class BatchJob:
+    """State of one background batch job, updated by the thread running it"""
+
+    # Only the most recent errors are kept so a failing sheet cannot grow memory
+    MAX_ERRORS = 50
+
+    def __init__(self, job_id: str, name: str, total: int, export_format: str,
+                 owner: Optional[str] = None):
+        self.job_id = job_id
+        # Sessions that may see and cancel the job; more join via `BatchJobManager.attach`
+        self.owners = {owner}
+        self.name = name
+        self.total = total
+        self.export_format = export_format
+        self.status = 'queued'
+        self.processed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.token = CancellationToken()
+        self.errors = []
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.output_file = None
+        self.error = None
+        self.lock = threading.Lock()
+
+    def record(self, result: Dict):
+        """Pipeline callback for every finished row"""
+        with self.lock:
+            if result.get('status') == 'cancelled':
+                self.cancelled += 1
+            elif 'error' in result:
+                # Timeouts are tracked apart from failures but listed with them
+                if result.get('status') == 'timeout':
+                    self.timed_out += 1
+                else:
+                    self.failed += 1
+                self.errors.append((result['content_id'], result['error']))
+                del self.errors[:-self.MAX_ERRORS]
+            else:
+                self.processed += 1
+
+    def snapshot(self) -> Dict:
+        """Return a consistent copy of the job state for rendering"""
+        with self.lock:
+            finished = self.processed + self.failed + self.timed_out + self.cancelled
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            return {
+                'job_id': self.job_id,
+                'name': self.name,
+                'status': self.status,
+                'total': self.total,
+                'processed': self.processed,
+                'failed': self.failed,
+                'timed_out': self.timed_out,
+                'cancelled': self.cancelled,
+                'finished': finished,
+                'errors': list(self.errors),
+                'elapsed': elapsed,
+                'avg_time': elapsed / finished if finished else 0.0,
+                'output_file': self.output_file,
+                'export_format': self.export_format,
+                'error': self.error,
+            }
+
+
+class BatchJobManager:
+    """Runs batch jobs on a background executor that outlives Streamlit reruns.
+
+    Up to `max_running` jobs run at once; further submissions wait in the
+    executor's queue. The page only reads job snapshots, so interacting with
+    widgets or leaving the page never interrupts a job. The manager is shared
+    by every session, so jobs carry their owners and are only listed for and
+    cancelled by them. Another session can join a job by its id with `attach`.
+    """
+
+    def __init__(self, max_running: int = 2, max_history: int = 20):
+        self.max_history = max_history
+        self.lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max_running,
+                                            thread_name_prefix="batch-job")
+
+    def submit(self, captioning_system, df: pd.DataFrame, name: str,
+               export_format: str = 'xlsx', pack_size: int = 1,
+               plan: Optional[AnalysisPlan] = None, owner: Optional[str] = None) -> str:
+        """
+        Queue a batch job for the rows of `df`, owned by `owner`.
+
+        Returns:
+            job_id: Identifier used to poll the job
+        """
+        job = BatchJob(str(uuid.uuid4()), name, len(df), export_format, owner)
+        with self.lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        # Neither the pipeline nor the export modifies `df`, so it is not copied
+        self._executor.submit(self._run, job, captioning_system, df, pack_size, plan)
+        return job.job_id
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond `max_history`"""
+        finished = [job_id for job_id, job in self._jobs.items()
+                    if job.status in ('completed', 'cancelled', 'failed')]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: BatchJob, captioning_system, df: pd.DataFrame,
+             pack_size: int, plan: Optional[AnalysisPlan]):
+        with job.lock:
+            if job.token.cancelled:
+                job.status = 'cancelled'
+                job.finished_at = job.started_at = time.time()
+                return
+            job.status = 'running'
+            job.started_at = time.time()
+
+        spool = ResultSpool()
+        try:
+            pipeline = BatchPipeline(captioning_system, pack_size=pack_size, plan=plan)
+            pipeline.run(BatchPipeline.rows_from_dataframe(df), spool, job.record, job.token)
+            spool.close()
+            # A cancelled job still delivers everything finished before the cancel
+            output_file = ExcelProcessor().save_results(df, spool, job.name, job.export_format)
+            with job.lock:
+                job.output_file = output_file
+                job.status = 'cancelled' if job.token.cancelled else 'completed'
+        except Exception as e:
+            with job.lock:
+                job.error = str(e)
+                job.status = 'failed'
+        finally:
+            spool.remove()
+            with job.lock:
+                job.finished_at = time.time()
+
+    def cancel(self, job_id: str, owner: Optional[str] = None) -> bool:
+        """Request cancellation of a queued or running job belonging to `owner`"""
+        job = self.get(job_id, owner)
+        if job is None or job.status not in ('queued', 'running'):
+            return False
+        job.token.cancel()
+        return True
+
+    def attach(self, job_id: str, owner: Optional[str] = None) -> bool:
+        """Give `owner` access to the job with `job_id`, e.g. from a new session; False if unknown"""
+        with self.lock:
+            job = self._jobs.get(job_id.strip())
+            if job is None:
+                return False
+            job.owners.add(owner)
+            return True
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[BatchJob]:
+        """Return the job with `job_id` if it is still tracked and belongs to `owner`"""
+        with self.lock:
+            job = self._jobs.get(job_id)
+            if job is None or owner not in job.owners:
+                return None
+            return job
+
+    def list_jobs(self, owner: Optional[str] = None) -> List[Dict]:
+        """Return snapshots of the jobs belonging to `owner`, newest first"""
+        with self.lock:
+            jobs = [job for job in self._jobs.values() if owner in job.owners]
+        return [job.snapshot() for job in reversed(jobs)]
+
+    def has_active_jobs(self, owner: Optional[str] = None) -> bool:
+        """Whether any job of `owner` is still queued or running"""
+        with self.lock:
+            return any(job.status in ('queued', 'running')
+                       for job in self._jobs.values() if owner in job.owners)
@@ -0,0 +1,317 @@
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from img_pro import ImageProcessor
+from analysis_plan import AnalysisPlan
+from deadline import Cancelled, CancellationToken, Deadline, DeadlineExceeded
+from scheduler import BATCH
+
+# Sentinel passed down the queues once a stage has no more work
+_DONE = object()
+
+
+class ResultSpool:
+    """Append-only JSONL file that keeps batch results on disk instead of in memory"""
+
+    def __init__(self, path: Optional[str] = None):
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="batch_results_", suffix=".jsonl")
+            os.close(fd)
+        self.path = path
+        self.count = 0
+        self._file = open(path, "w", encoding="utf-8")
+
+    def append(self, result: Dict):
+        """Write a single result and flush it to disk"""
+        self._file.write(json.dumps(result, default=str) + "\n")
+        self._file.flush()
+        self.count += 1
+
+    def close(self):
+        """Close the spool for writing; it can still be iterated"""
+        if not self._file.closed:
+            self._file.close()
+
+    def remove(self):
+        """Close the spool and delete its backing file"""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[Dict]:
+        """Stream results back from disk one at a time"""
+        if not self._file.closed:
+            self._file.flush()
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+class BatchPipeline:
+    """Staged batch pipeline: read rows -> download -> decode -> caption -> persist.
+
+    Stages run in worker threads connected by bounded queues, so a slow stage
+    blocks the stages feeding it instead of letting work pile up in memory.
+    Downloaded bytes and decoded images are released as soon as the stage that
+    needs them finishes. The persist stage runs on the calling thread, which
+    keeps any Streamlit calls made from `on_result` on the script thread.
+    """
+
+    def __init__(self, captioning_system, queue_size: int = 4,
+                 download_workers: int = 2, caption_workers: Optional[int] = None,
+                 pack_size: int = 1, pack_wait: float = 0.5,
+                 plan: Optional[AnalysisPlan] = None,
+                 item_timeout: Optional[float] = 180.0, stage_timeout: Optional[float] = 60.0,
+                 priority: str = BATCH):
+        """
+        Args:
+            captioning_system: ImageCaptioningSystem used for the caption stage
+            queue_size: Capacity of each queue between stages
+            download_workers: Number of concurrent downloads
+            caption_workers: Number of rows captioned concurrently; defaults to
+                the scheduler capacity open to `priority`, so batches use all
+                of the quota that is not reserved for interactive work
+            pack_size: Images sent per caption request; values above 1 trade
+                latency for throughput using packed requests
+            pack_wait: Seconds the caption stage waits to fill a pack
+            plan: Execution plan for every row; defaults to the full chain
+            item_timeout: Seconds the caption stage may spend on a row, including
+                waits for scheduler slots
+            stage_timeout: Seconds allowed for the download, the decode and
+                each model call of a row
+            priority: Scheduler class for the caption requests, BATCH or BACKFILL
+        """
+        self.captioning_system = captioning_system
+        self.queue_size = queue_size
+        self.download_workers = download_workers
+        if caption_workers is None:
+            caption_workers = captioning_system.scheduler.limit(priority)
+        self.caption_workers = caption_workers
+        self.pack_size = max(1, pack_size)
+        self.pack_wait = pack_wait
+        self.plan = plan
+        self.item_timeout = item_timeout
+        self.stage_timeout = stage_timeout
+        self.priority = priority
+
+    @staticmethod
+    def rows_from_dataframe(df: pd.DataFrame) -> Iterator[Dict]:
+        """Lazily yield the columns the pipeline needs from an input sheet"""
+        for content_id, url in df[['content_id', 'URL']].itertuples(index=False):
+            yield {'content_id': content_id, 'url': url}
+
+    def _stage_deadline(self, item: Dict) -> Deadline:
+        return Deadline(self.stage_timeout, token=item['token'])
+
+    def _item_deadline(self, item: Dict) -> Deadline:
+        # Started by the caption stage, so time spent waiting in the queues
+        # between stages never counts against a row's budget
+        return Deadline(self.item_timeout, self.stage_timeout, item['token'])
+
+    def _download(self, item: Dict):
+        item['data'] = ImageProcessor.download_image_bytes(
+            item['url'], self.captioning_system.http_cache, self._stage_deadline(item)
+        )
+
+    def _decode(self, item: Dict):
+        item['image'] = ImageProcessor.decode_image(item.pop('data'), self._stage_deadline(item))
+
+    def _caption(self, item: Dict):
+        image = item.pop('image')
+        try:
+            item['components'] = self.captioning_system.analyze_image(
+                image, self.plan, self._item_deadline(item), self.priority
+            )
+        finally:
+            image.close()
+
+    def _caption_packed(self, items: List[Dict]):
+        # A pack shares one budget, started when its request is made
+        deadline = self._item_deadline(items[0])
+        images = [(position, item.pop('image')) for position, item in enumerate(items)]
+        try:
+            results = self.captioning_system.analyze_images(
+                images, self.plan, deadline, self.priority
+            )
+        finally:
+            for _, image in images:
+                image.close()
+        for position, item in enumerate(items):
+            result = results.get(position)
+            if isinstance(result, dict):
+                item['components'] = result
+            else:
+                self._fail(item, result or Exception("No result returned"))
+
+    @classmethod
+    def _fail(cls, item: Dict, error: Exception):
+        """Mark an item as timed out, cancelled or failed and release its payload"""
+        if isinstance(error, DeadlineExceeded):
+            item['status'] = 'timeout'
+        elif isinstance(error, Cancelled):
+            item['status'] = 'cancelled'
+        else:
+            item['status'] = 'failed'
+        item['error'] = str(error)
+        cls._release(item)
+
+    @staticmethod
+    def _release(item: Dict):
+        """Drop any payload still attached to a failed item"""
+        item.pop('data', None)
+        image = item.pop('image', None)
+        if image is not None:
+            image.close()
+
+    def _start_stage(self, func: Callable, inbox: queue.Queue,
+                     outbox: queue.Queue, workers: int, batch_size: int = 1):
+        """
+        Start `workers` threads applying `func` to items from `inbox`.
+        
+        With `batch_size` above 1, `func` receives lists of up to that many
+        items. A single collector thread fills each list, waiting at most
+        `pack_wait` seconds for the next item, so concurrent workers never
+        split one pack between them.
+        """
+        state = {'remaining': workers}
+        lock = threading.Lock()
+
+        def apply(batch):
+            stage_start = time.time()
+            try:
+                if self._token.cancelled:
+                    raise Cancelled("Cancelled")
+                func(batch[0] if batch_size == 1 else batch)
+            except Exception as e:
+                for item in batch:
+                    self._fail(item, e)
+            # Packed items share the cost of their request
+            elapsed = (time.time() - stage_start) / len(batch)
+            for item in batch:
+                item['processing_time'] += elapsed
+                outbox.put(item)
+
+        def collect(packs: queue.Queue):
+            done = False
+            while not done:
+                pack = []
+                item = inbox.get()
+                while True:
+                    if item is _DONE:
+                        done = True
+                        break
+                    if 'error' in item:
+                        outbox.put(item)
+                    else:
+                        pack.append(item)
+                    if len(pack) >= batch_size:
+                        break
+                    try:
+                        item = inbox.get(timeout=self.pack_wait)
+                    except queue.Empty:
+                        break
+                if pack:
+                    packs.put(pack)
+            packs.put(_DONE)
+
+        def worker(source: queue.Queue):
+            while True:
+                batch = source.get()
+                if batch is _DONE:
+                    # Leave the sentinel for sibling workers of this stage
+                    source.put(_DONE)
+                    break
+                if batch_size == 1:
+                    if 'error' in batch:
+                        outbox.put(batch)
+                        continue
+                    batch = [batch]
+                apply(batch)
+            with lock:
+                state['remaining'] -= 1
+                last = state['remaining'] == 0
+            if last:
+                outbox.put(_DONE)
+
+        source = inbox
+        if batch_size > 1:
+            source = queue.Queue(maxsize=workers)
+            threading.Thread(target=collect, args=(source,), daemon=True).start()
+        for _ in range(workers):
+            threading.Thread(target=worker, args=(source,), daemon=True).start()
+
+    def run(self, rows: Iterable[Dict], spool: ResultSpool,
+            on_result: Optional[Callable[[Dict], None]] = None,
+            token: Optional[CancellationToken] = None) -> Dict:
+        """
+        Run every row through the pipeline, flushing results to `spool`.
+
+        Args:
+            rows: Iterable of dicts with 'content_id' and 'url' keys
+            spool: Storage that successful results are appended to
+            on_result: Called on the calling thread for every finished row;
+                unsuccessful rows carry 'error' and a 'status' of 'failed',
+                'timeout' or 'cancelled'
+            token: Cancels the run; rows already persisted are kept
+
+        Returns:
+            Dictionary with processed, failed, timed_out, cancelled and
+            elapsed statistics
+        """
+        self._token = token or CancellationToken()
+        read_q = queue.Queue(maxsize=self.queue_size)
+        decode_q = queue.Queue(maxsize=self.queue_size)
+        # Large enough for the caption stage to fill a whole pack
+        caption_q = queue.Queue(maxsize=max(self.queue_size, self.pack_size))
+        persist_q = queue.Queue(maxsize=self.queue_size)
+
+        def reader():
+            for row in rows:
+                # Stop reading new rows once cancelled; in-flight rows drain as cancelled
+                if self._token.cancelled:
+                    break
+                read_q.put({'content_id': row['content_id'], 'url': row['url'],
+                            'token': self._token, 'processing_time': 0.0})
+            read_q.put(_DONE)
+
+        threading.Thread(target=reader, daemon=True).start()
+        self._start_stage(self._download, read_q, decode_q, self.download_workers)
+        self._start_stage(self._decode, decode_q, caption_q, 1)
+        if self.pack_size > 1:
+            self._start_stage(self._caption_packed, caption_q, persist_q,
+                              self.caption_workers, batch_size=self.pack_size)
+        else:
+            self._start_stage(self._caption, caption_q, persist_q, self.caption_workers)
+
+        stats = {'processed': 0, 'failed': 0, 'timed_out': 0, 'cancelled': 0, 'elapsed': 0.0}
+        stat_keys = {'failed': 'failed', 'timeout': 'timed_out', 'cancelled': 'cancelled'}
+        batch_start = time.time()
+        while True:
+            item = persist_q.get()
+            if item is _DONE:
+                break
+            if 'error' in item:
+                result = {'content_id': item['content_id'], 'error': item['error'],
+                          'status': item['status']}
+                stats[stat_keys[item['status']]] += 1
+            else:
+                result = dict(item['components'])
+                result['content_id'] = item['content_id']
+                result['processing_time'] = item['processing_time']
+                spool.append(result)
+                stats['processed'] += 1
+            if on_result:
+                on_result(result)
+
+        stats['elapsed'] = time.time() - batch_start
+        return stats
@@ -1,43 +1,55 @@
 # cap_chain.py
-from typing import Dict
+import asyncio
+import json
+from typing import Any, Dict, Hashable, Iterator, List, Tuple
 from PIL import Image
 
+from analysis_plan import AnalysisPlan, CORE_SECTIONS
+from deadline import Cancelled, Deadline, DeadlineExceeded, wait_for_deadline
+from scheduler import INTERACTIVE, RequestScheduler
+
 class CaptioningChain:
     """Enhanced chain for image captioning using dual Gemini Vision models"""
     
-    def __init__(self, model1, model2):
+    def __init__(self, model1, model2, scheduler: RequestScheduler = None):
         self.primary_model = model1
         self.secondary_model = model2
+        # Every generate_content call takes one slot, so the scheduler sees the real request rate
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
         self._init_prompts()
 
     def _init_prompts(self):
         """Initialize detailed prompts for each component"""
-        self.prompts = {
-            "base_description": """
-            Provide a clear, factual description of the key elements visible in this image.
-            Focus on the main subjects, actions, and setting in 2-3 sentences.
-            """,
-            "detailed_analysis": """
-            Please provide a detailed analysis of this image with the following sections:
-
-            1. Subject Analysis (People, Objects, Actions):
+        self.analysis_sections = {
+            "subject": """Subject Analysis (People, Objects, Actions):
             - Describe all visible people, their appearance, Ethnicity, skin color, clothing, and actions
             - Detail important objects, their characteristics and placement
-            - Note any significant interactions or movements
-
-            2. Environment and Setting:
+            - Note any significant interactions or movements""",
+            "environment": """Environment and Setting:
             - Describe the location and surroundings
             - Note lighting conditions and atmosphere
-            - Identify any notable background elements
-
-            3. Technical Aspects:
+            - Identify any notable background elements""",
+            "technical": """Technical Aspects:
             - Camera angle and shot type
             - Lighting quality and direction
             - Composition and framing
-            - Any notable photographic techniques used
-
-            Be objective and focus only on visible elements.
+            - Any notable photographic techniques used""",
+            "text": """Visible Text:
+            - Transcribe any legible text, signs, or labels
+            - Note where the text appears in the image""",
+            "emotions": """Mood and Emotions:
+            - Describe facial expressions and body language
+            - Note the overall emotional tone of the scene""",
+        }
+        self.short_description_prompt = """
+            Describe this image in one short, factual sentence.
+            """
+        self.prompts = {
+            "base_description": """
+            Provide a clear, factual description of the key elements visible in this image.
+            Focus on the main subjects, actions, and setting in 2-3 sentences.
             """,
+            "detailed_analysis": self._build_detailed_prompt(CORE_SECTIONS),
             "final_summary": """
             Create a comprehensive yet concise summary (2-3 sentences) that captures:
             - The key visual elements and their relationships
@@ -46,27 +58,129 @@ class CaptioningChain:
             """
         }
 
-    def _generate_with_context(self, image: Image.Image, prompt: str, 
-                             context: Dict[str, str] = None) -> str:
-        """Generate content with context awareness"""
-        # Construct the complete prompt
+    def _build_detailed_prompt(self, sections) -> str:
+        """Assemble the detailed analysis prompt from the requested sections"""
+        body = "\n\n".join(
+            f"            {number}. {self.analysis_sections[section]}"
+            for number, section in enumerate(sections, start=1)
+        )
+        return f"""
+            Please provide a detailed analysis of this image with the following sections:
+
+{body}
+
+            Be objective and focus only on visible elements.
+            """
+
+    def prompts_for(self, plan: AnalysisPlan = None) -> Dict[str, str]:
+        """Return the ordered stage prompts an execution plan asks for"""
+        if plan is None:
+            return self.prompts
+        
+        prompts = {}
+        for stage in plan.stages:
+            if stage == "base_description" and plan.short:
+                prompts[stage] = self.short_description_prompt
+            elif stage == "detailed_analysis":
+                prompts[stage] = self._build_detailed_prompt(plan.sections)
+            else:
+                prompts[stage] = self.prompts[stage]
+        return prompts
+
+    def _build_prompt(self, prompt: str, context: Dict[str, str] = None) -> str:
+        """Prefix the task prompt with the results of earlier stages"""
         if context:
-            enhanced_prompt = f"""
+            return f"""
             Previous Analysis Context:
             {str(context)}
             
             New Analysis Task:
             {prompt}
             """
-        else:
-            enhanced_prompt = prompt
-            
-        # Alternate between models for load balancing
-        model = self.primary_model if len(context or {}) % 2 == 0 else self.secondary_model
+        return prompt
+
+    def _select_model(self, context: Dict[str, str] = None):
+        """Alternate between models for load balancing"""
+        return self.primary_model if len(context or {}) % 2 == 0 else self.secondary_model
+
+    @staticmethod
+    def _request_options(deadline: Deadline = None) -> Dict:
+        """Per-call request options carrying the stage timeout to the model client"""
+        if deadline is None:
+            return {}
+        timeout = deadline.timeout()
+        return {"timeout": timeout} if timeout is not None else {}
+
+    def _generate_with_context(self, image: Image.Image, prompt: str, 
+                             context: Dict[str, str] = None,
+                             deadline: Deadline = None, priority: str = INTERACTIVE) -> str:
+        """Generate content with context awareness"""
+        enhanced_prompt = self._build_prompt(prompt, context)
+        model = self._select_model(context)
         
         try:
-            response = model.generate_content([enhanced_prompt, image])
+            with self.scheduler.hold(priority, deadline):
+                stage = deadline.stage() if deadline else None
+                response = model.generate_content(
+                    [enhanced_prompt, image],
+                    request_options=self._request_options(stage)
+                )
             return response.text
+        except (DeadlineExceeded, Cancelled):
+            raise
+        except Exception as e:
+            raise Exception(f"Image analysis failed: {str(e)}")
+
+    async def _agenerate_with_context(self, image: Image.Image, prompt: str,
+                                      context: Dict[str, str] = None,
+                                      deadline: Deadline = None,
+                                      priority: str = INTERACTIVE, ticket: object = None) -> str:
+        """Async version of `_generate_with_context`; `ticket` identifies the caller to the scheduler"""
+        enhanced_prompt = self._build_prompt(prompt, context)
+        model = self._select_model(context)
+        
+        try:
+            async with self.scheduler.slot(priority, deadline, ticket):
+                # The stage budget starts once the request is admitted
+                stage = deadline.stage() if deadline else None
+                response = await wait_for_deadline(
+                    model.generate_content_async(
+                        [enhanced_prompt, image],
+                        request_options=self._request_options(stage)
+                    ),
+                    stage
+                )
+            return response.text
+        except (DeadlineExceeded, Cancelled):
+            raise
+        except Exception as e:
+            raise Exception(f"Image analysis failed: {str(e)}")
+
+    def _stream_with_context(self, image: Image.Image, prompt: str,
+                             context: Dict[str, str] = None,
+                             deadline: Deadline = None,
+                             priority: str = INTERACTIVE) -> Iterator[str]:
+        """Generate content with context awareness, yielding text chunks as they arrive"""
+        enhanced_prompt = self._build_prompt(prompt, context)
+        model = self._select_model(context)
+        
+        try:
+            # The slot is held until the stream is fully read or abandoned
+            with self.scheduler.hold(priority, deadline):
+                stage = deadline.stage() if deadline else None
+                response = model.generate_content(
+                    [enhanced_prompt, image],
+                    stream=True,
+                    request_options=self._request_options(stage)
+                )
+                for chunk in response:
+                    if stage:
+                        stage.check()
+                    # `.text` raises on chunks without parts, e.g. a trailing or safety-stopped chunk
+                    if chunk.parts and chunk.text:
+                        yield chunk.text
+        except (DeadlineExceeded, Cancelled):
+            raise
         except Exception as e:
             raise Exception(f"Image analysis failed: {str(e)}")
 
@@ -77,8 +191,158 @@ class CaptioningChain:
         context = {}
         
         # Generate components sequentially with context
-        for key, prompt in self.prompts.items():
-            results[key] = self._generate_with_context(image, prompt, context)
+        for key, prompt in self.prompts_for(inputs.get("plan")).items():
+            results[key] = self._generate_with_context(
+                image, prompt, context, inputs.get("deadline"), inputs.get("priority", INTERACTIVE)
+            )
             context[key] = results[key]
         
         return results
+
+    async def acall(self, inputs: Dict) -> Dict[str, str]:
+        """Async version of `__call__`"""
+        image = inputs["image"]
+        results = {}
+        context = {}
+        
+        for key, prompt in self.prompts_for(inputs.get("plan")).items():
+            # Read per call, so a caller may raise the priority of work already running
+            results[key] = await self._agenerate_with_context(
+                image, prompt, context, inputs.get("deadline"), inputs.get("priority", INTERACTIVE),
+                inputs.get("ticket")
+            )
+            context[key] = results[key]
+        
+        return results
+
+    def _build_packed_prompt(self, count: int, prompts: Dict[str, str]) -> str:
+        """Build one shared prompt asking for every component of `count` images"""
+        tasks = "\n".join(
+            f'"{key}":\n{prompt.strip()}' for key, prompt in prompts.items()
+        )
+        keys = ", ".join(f'"{key}"' for key in prompts)
+        return f"""
+        You are given {count} images, each preceded by its label "Image 1" to "Image {count}".
+        Analyze every image independently and produce the following components for each:
+
+        {tasks}
+
+        Respond with a single JSON object only. Its keys must be the image numbers as
+        strings ("1" to "{count}") and each value must be an object with the keys {keys},
+        whose values are plain strings.
+        """
+
+    def _parse_packed_response(self, text: str, count: int,
+                               prompts: Dict[str, str]) -> Dict[int, Dict[str, str]]:
+        """Extract the well-formed per-image results from a packed response"""
+        text = text.strip()
+        if text.startswith("```"):
+            text = text.strip("`")
+            text = text[text.find("{"):]
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            return {}
+        if not isinstance(payload, dict):
+            return {}
+        
+        parsed = {}
+        for index in range(1, count + 1):
+            entry = payload.get(str(index))
+            if not isinstance(entry, dict):
+                continue
+            if all(isinstance(entry.get(key), str) and entry[key].strip() for key in prompts):
+                parsed[index] = {key: entry[key] for key in prompts}
+        return parsed
+
+    async def acall_packed(self, images: List[Tuple[Hashable, Image.Image]],
+                           plan: AnalysisPlan = None, deadline: Deadline = None,
+                           priority: str = INTERACTIVE) -> Dict[Hashable, Any]:
+        """
+        Analyze several images with a single shared-prompt request.
+        
+        Args:
+            images: (id, image) pairs; ids are chosen by the caller, e.g. content_id
+            plan: Execution plan selecting the components; defaults to the full chain
+            deadline: Budget shared by the packed request and any fallbacks
+            priority: Scheduler class of the packed request and any fallbacks
+            
+        Returns:
+            Mapping of each id to its components, or to the exception raised by
+            the packed request or by the single-image fallback. Only images missing
+            from a response that arrived are retried one by one; DeadlineExceeded
+            and Cancelled from the packed request itself are raised
+        """
+        if len(images) == 1:
+            image_id, image = images[0]
+            try:
+                return {image_id: await self.acall(
+                    {"image": image, "plan": plan, "deadline": deadline, "priority": priority}
+                )}
+            except Exception as e:
+                return {image_id: e}
+        
+        prompts = self.prompts_for(plan)
+        contents = [self._build_packed_prompt(len(images), prompts)]
+        for index, (_, image) in enumerate(images, start=1):
+            contents.extend([f"Image {index}:", image])
+        
+        try:
+            async with self.scheduler.slot(priority, deadline):
+                stage = deadline.stage() if deadline else None
+                response = await wait_for_deadline(
+                    self.primary_model.generate_content_async(
+                        contents,
+                        generation_config={"response_mime_type": "application/json"},
+                        request_options=self._request_options(stage)
+                    ),
+                    stage
+                )
+        except (DeadlineExceeded, Cancelled):
+            raise
+        except Exception as e:
+            # A failed request, e.g. a quota error, is not retried per image; that would
+            # multiply the load on keys that are already throttled
+            error = Exception(f"Image analysis failed: {str(e)}")
+            return {image_id: error for image_id, _ in images}
+        
+        try:
+            parsed = self._parse_packed_response(response.text, len(images), prompts)
+        except ValueError:
+            # `.text` raises when the response has no parts, e.g. a blocked response
+            parsed = {}
+        
+        results = {}
+        fallback = []
+        for index, (image_id, image) in enumerate(images, start=1):
+            if index in parsed:
+                results[image_id] = parsed[index]
+            else:
+                fallback.append((image_id, image))
+        
+        # Only the images missing from a malformed response are retried one by one
+        if fallback:
+            retried = await asyncio.gather(
+                *(self.acall({"image": image, "plan": plan, "deadline": deadline,
+                              "priority": priority})
+                  for _, image in fallback),
+                return_exceptions=True
+            )
+            for (image_id, _), result in zip(fallback, retried):
+                results[image_id] = result
+        
+        return results
+
+    def stream(self, inputs: Dict) -> Iterator[Tuple[str, str]]:
+        """Execute the chain, yielding (component, text chunk) pairs as each stage streams in"""
+        image = inputs["image"]
+        context = {}
+        
+        for key, prompt in self.prompts_for(inputs.get("plan")).items():
+            chunks = []
+            for chunk in self._stream_with_context(image, prompt, context, inputs.get("deadline"),
+                                                   inputs.get("priority", INTERACTIVE)):
+                chunks.append(chunk)
+                yield key, chunk
+            # Later stages only see a stage once it has fully completed
+            context[key] = "".join(chunks)
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+from typing import Awaitable, Optional
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an item or stage runs past its time budget"""
+
+
+class Cancelled(Exception):
+    """Raised when the work an item belongs to has been cancelled"""
+
+
+class CancellationToken:
+    """Thread-safe flag shared by every item of a batch to request cancellation"""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """Request cancellation; running stages stop at their next check"""
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        """Raise Cancelled if cancellation was requested"""
+        if self._event.is_set():
+            raise Cancelled("Cancelled")
+
+
+class Deadline:
+    """Time budget for one item, with an optional cap for each of its stages.
+
+    The same deadline is passed through download, decode and every model
+    call; each stage asks `stage()` for a child deadline bounded by both the
+    stage budget and whatever is left of the item budget.
+    """
+
+    def __init__(self, budget: Optional[float] = None, stage_budget: Optional[float] = None,
+                 token: Optional[CancellationToken] = None):
+        self.expires_at = time.monotonic() + budget if budget is not None else None
+        self.stage_budget = stage_budget
+        self.token = token
+
+    def stage(self) -> "Deadline":
+        """Return the deadline for the next stage of this item"""
+        child = Deadline(token=self.token)
+        child.expires_at = self.expires_at
+        if self.stage_budget is not None:
+            stage_expiry = time.monotonic() + self.stage_budget
+            if child.expires_at is None or stage_expiry < child.expires_at:
+                child.expires_at = stage_expiry
+        return child
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left, or None when unbounded"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def check(self):
+        """Raise Cancelled or DeadlineExceeded if the work should stop now"""
+        if self.token is not None:
+            self.token.check()
+        if self.expired:
+            raise DeadlineExceeded("Deadline exceeded")
+
+    def timeout(self) -> Optional[float]:
+        """Check the deadline and return the remaining seconds for use as an I/O timeout"""
+        self.check()
+        return self.remaining()
+
+
+async def wait_for_deadline(awaitable: Awaitable, deadline: Optional[Deadline]):
+    """Await `awaitable`, giving up with DeadlineExceeded once `deadline` passes"""
+    if deadline is None:
+        return await awaitable
+    try:
+        timeout = deadline.timeout()
+    except Exception:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Deadline exceeded")
@@ -0,0 +1,49 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Optional
+
+
+class BackgroundEventLoop:
+    """An asyncio event loop running forever in a daemon thread.
+
+    Synchronous code (the Streamlit script thread, batch workers) submits
+    coroutines to it, so every async client in the process lives on one loop.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self.lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Return the running loop, starting its thread on first use"""
+        with self.lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="captioning-event-loop",
+                    daemon=True
+                )
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro: Awaitable) -> Future:
+        """Schedule a coroutine on the loop and return a concurrent future for it"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None):
+        """Run a coroutine on the loop and block until it finishes"""
+        if self._thread is not None and threading.current_thread() is self._thread:
+            raise RuntimeError("Cannot block on the background event loop from inside it")
+        return self.submit(coro).result(timeout)
+
+
+_shared_loop = BackgroundEventLoop()
+
+
+def get_event_loop() -> BackgroundEventLoop:
+    """Return the process-wide background event loop"""
+    return _shared_loop
@@ -1,7 +1,22 @@
+import os
+import sqlite3
+import tempfile
 import pandas as pd
-from typing import Dict, List
+from contextlib import closing
+from typing import Dict, Iterable
 from datetime import datetime
 
+from exporters import EXPORT_FORMATS, chunk_dataframe, export_chunks
+
+# Output columns filled from each result, and the result keys they come from
+RESULT_COLUMNS = {
+    'Base_Description': 'base_description',
+    'Subject Analysis (People, Objects, Actions)': 'detailed_analysis',
+    'Environment and Setting': 'environment_setting',
+    'Technical Aspects': 'technical_aspects',
+    'Final_Summary': 'final_summary',
+}
+
 class ExcelProcessor:
     def __init__(self):
         self.columns = [
@@ -23,25 +38,74 @@ class ExcelProcessor:
         except Exception as e:
             raise Exception(f"Failed to load Excel file: {str(e)}")
 
-    def save_results(self, input_df: pd.DataFrame, results: List[Dict], output_path: str):
-        """Save the results to a new Excel file"""
+    def save_results(self, input_df: pd.DataFrame, results: Iterable[Dict], output_path: str,
+                     fmt: str = 'xlsx', chunksize: int = 10000):
+        """Save the results to a new file; `results` may be any iterable, e.g. a spool on disk.
+        
+        `fmt` selects the output format: 'xlsx', 'parquet', 'csv' or 'jsonl'.
+        Results are indexed in a temporary SQLite file and joined to the input
+        sheet one chunk at a time, so memory stays bounded by `chunksize`.
+        """
+        fd, index_path = tempfile.mkstemp(prefix="batch_index_", suffix=".db")
+        os.close(fd)
         try:
-            # Create a copy of input DataFrame
-            output_df = input_df.copy()
-            
-            # Update with results
-            for result in results:
-                idx = output_df[output_df['content_id'] == result['content_id']].index[0]
-                output_df.loc[idx, 'Base_Description'] = result.get('base_description', '')
-                output_df.loc[idx, 'Subject Analysis (People, Objects, Actions)'] = result.get('detailed_analysis', '')
-                output_df.loc[idx, 'Environment and Setting'] = result.get('environment_setting', '')
-                output_df.loc[idx, 'Technical Aspects'] = result.get('technical_aspects', '')
-                output_df.loc[idx, 'Final_Summary'] = result.get('final_summary', '')
-            
-            # Save to new file
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            output_file = f"{output_path}_processed_{timestamp}.xlsx"
-            output_df.to_excel(output_file, index=False)
-            return output_file
+            with closing(sqlite3.connect(index_path)) as conn:
+                self._index_results(conn, results)
+                
+                # Save to new file
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                output_file = f"{output_path}_processed_{timestamp}{EXPORT_FORMATS[fmt]['extension']}"
+                chunks = (self._join_results(conn, chunk)
+                          for chunk in chunk_dataframe(input_df, chunksize))
+                return export_chunks(chunks, output_file, fmt)
         except Exception as e:
             raise Exception(f"Failed to save results: {str(e)}")
+        finally:
+            os.remove(index_path)
+
+    @staticmethod
+    def _index_results(conn: sqlite3.Connection, results: Iterable[Dict], batch_size: int = 1000):
+        """Load results into an on-disk table keyed by the stringified content_id"""
+        placeholders = ", ".join("?" for _ in range(len(RESULT_COLUMNS) + 1))
+        conn.execute(f"CREATE TABLE results (content_id TEXT PRIMARY KEY, "
+                     f"{', '.join(f'c{i} TEXT' for i in range(len(RESULT_COLUMNS)))})")
+        batch = []
+        for result in results:
+            # Ids are compared as strings since a spool round-trips non-JSON ids as str
+            batch.append([str(result['content_id'])] +
+                         [result.get(key, '') for key in RESULT_COLUMNS.values()])
+            if len(batch) >= batch_size:
+                conn.executemany(f"INSERT OR REPLACE INTO results VALUES ({placeholders})", batch)
+                batch = []
+        if batch:
+            conn.executemany(f"INSERT OR REPLACE INTO results VALUES ({placeholders})", batch)
+        conn.commit()
+
+    @staticmethod
+    def _join_results(conn: sqlite3.Connection, chunk: pd.DataFrame,
+                      batch_size: int = 500) -> pd.DataFrame:
+        """Return a copy of `chunk` with the result columns filled from the index"""
+        keys = chunk['content_id'].map(str)
+        found = {}
+        unique_keys = list(keys.unique())
+        for start in range(0, len(unique_keys), batch_size):
+            batch = unique_keys[start:start + batch_size]
+            marks = ", ".join("?" for _ in batch)
+            for row in conn.execute(f"SELECT * FROM results WHERE content_id IN ({marks})", batch):
+                found[row[0]] = row[1:]
+            # Only the first row with an id receives its result, as in the source sheet order
+            conn.execute(f"DELETE FROM results WHERE content_id IN ({marks})", batch)
+        
+        first = ~keys.duplicated()
+        matched = keys.map(lambda key: key in found) & first
+        rows = [found[key] if hit else (None,) * len(RESULT_COLUMNS)
+                for key, hit in zip(keys, matched)]
+        values = pd.DataFrame(rows, index=chunk.index, columns=list(RESULT_COLUMNS), dtype=object)
+        
+        output = chunk.copy()
+        for column in RESULT_COLUMNS:
+            if column in output:
+                output[column] = values[column].where(matched, output[column])
+            else:
+                output[column] = values[column]
+        return output
@@ -0,0 +1,115 @@
+from typing import Iterable, Iterator
+
+import pandas as pd
+
+# Supported export formats with their file extension and download MIME type
+EXPORT_FORMATS = {
+    'xlsx': {
+        'extension': '.xlsx',
+        'mime': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    },
+    'parquet': {
+        'extension': '.parquet',
+        'mime': 'application/vnd.apache.parquet'
+    },
+    'csv': {
+        'extension': '.csv',
+        'mime': 'text/csv'
+    },
+    'jsonl': {
+        'extension': '.jsonl',
+        'mime': 'application/jsonl'
+    },
+}
+
+
+def chunk_dataframe(df: pd.DataFrame, chunksize: int = 10000) -> Iterator[pd.DataFrame]:
+    """Split a DataFrame into row slices for the chunked writers"""
+    if df.empty:
+        # Still hand the writers the columns so headers and schema are written
+        yield df
+        return
+    for start in range(0, len(df), chunksize):
+        yield df.iloc[start:start + chunksize]
+
+
+def _write_csv(chunks: Iterable[pd.DataFrame], output_path: str):
+    first = True
+    for chunk in chunks:
+        chunk.to_csv(output_path, mode='w' if first else 'a', header=first, index=False)
+        first = False
+    if first:
+        open(output_path, 'w').close()
+
+
+def _write_jsonl(chunks: Iterable[pd.DataFrame], output_path: str):
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            lines = chunk.to_json(orient='records', lines=True, force_ascii=False)
+            f.write(lines if lines.endswith('\n') else lines + '\n')
+
+
+def _write_parquet(chunks: Iterable[pd.DataFrame], output_path: str):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export requires pyarrow: pip install pyarrow")
+
+    writer = None
+    try:
+        for chunk in chunks:
+            # Text columns use the string dtype so all-empty chunks keep a stable schema
+            chunk = chunk.astype({
+                col: 'string' for col in chunk.columns if chunk[col].dtype == object
+            })
+            if writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(output_path, table.schema)
+            else:
+                table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+            writer.write_table(table)
+        if writer is None:
+            # No chunks at all; still produce a readable file
+            pq.write_table(pa.table({}), output_path)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _write_xlsx(chunks: Iterable[pd.DataFrame], output_path: str):
+    with pd.ExcelWriter(output_path, engine='openpyxl') as writer:
+        startrow = 0
+        for chunk in chunks:
+            chunk.to_excel(writer, index=False, header=startrow == 0, startrow=startrow)
+            startrow += len(chunk) + (1 if startrow == 0 else 0)
+        if startrow == 0:
+            pd.DataFrame().to_excel(writer, index=False)
+
+
+_WRITERS = {
+    'xlsx': _write_xlsx,
+    'parquet': _write_parquet,
+    'csv': _write_csv,
+    'jsonl': _write_jsonl,
+}
+
+
+def export_chunks(chunks: Iterable[pd.DataFrame], output_path: str, fmt: str = 'xlsx') -> str:
+    """
+    Stream DataFrame chunks to a file in the requested format.
+
+    Args:
+        chunks: DataFrames sharing the same columns, written in order
+        output_path: Destination file
+        fmt: One of EXPORT_FORMATS
+
+    Returns:
+        The path that was written
+    """
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    _WRITERS[fmt](chunks, output_path)
+    return output_path
@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Mapping, Optional, Tuple
+
+import httpx
+import requests
+
+
+def _parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """Parse a Cache-Control header into a directive -> value mapping"""
+    directives = {}
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+class DiskImageCache:
+    """Size-bounded on-disk cache of downloaded image bytes.
+
+    Honors Cache-Control max-age, no-cache and no-store. Stale entries are
+    revalidated with If-None-Match / If-Modified-Since, so an unchanged image
+    costs a 304 instead of a full download. The least recently used entries
+    are evicted once the cache grows past `max_bytes`.
+    """
+
+    def __init__(self, cache_dir: str = ".image_cache", max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(cache_dir, "index.db")
+        self.lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'hits': 0,
+            'revalidated': 0,
+            'misses': 0,
+            'bytes_saved': 0
+        }
+        os.makedirs(cache_dir, exist_ok=True)
+        self._init_database()
+
+    def _init_database(self):
+        """Create the index table if it doesn't exist"""
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS entries (
+                        url TEXT PRIMARY KEY,
+                        path TEXT NOT NULL,
+                        etag TEXT,
+                        last_modified TEXT,
+                        expires_at REAL,
+                        size INTEGER NOT NULL,
+                        last_access REAL NOT NULL
+                    )
+                ''')
+                conn.commit()
+
+    def _lookup(self, url: str) -> Optional[Dict]:
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.execute("SELECT * FROM entries WHERE url = ?", (url,))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                columns = [description[0] for description in cursor.description]
+                return dict(zip(columns, row))
+
+    def _read(self, entry: Dict) -> Optional[bytes]:
+        """Read an entry's bytes and mark it recently used; None if the file is gone"""
+        try:
+            with open(entry['path'], 'rb') as f:
+                data = f.read()
+        except OSError:
+            self._delete(entry['url'])
+            return None
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("UPDATE entries SET last_access = ? WHERE url = ?",
+                             (time.time(), entry['url']))
+                conn.commit()
+        return data
+
+    def _delete(self, url: str):
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute("SELECT path FROM entries WHERE url = ?", (url,)).fetchone()
+                conn.execute("DELETE FROM entries WHERE url = ?", (url,))
+                conn.commit()
+        if row and os.path.exists(row[0]):
+            os.remove(row[0])
+
+    @staticmethod
+    def _expiry(headers: Mapping[str, str]) -> Tuple[bool, Optional[float]]:
+        """Return whether a response may be stored and until when it is fresh"""
+        directives = _parse_cache_control(headers.get('Cache-Control'))
+        if 'no-store' in directives:
+            return False, None
+        if 'no-cache' in directives:
+            return True, None
+        try:
+            max_age = int(directives.get('max-age') or '')
+        except ValueError:
+            return True, None
+        return True, time.time() + max_age
+
+    def _store(self, url: str, data: bytes, headers: Mapping[str, str]):
+        storable, expires_at = self._expiry(headers)
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        # Without validators or a lifetime a cached copy could never be reused
+        if not storable or not (etag or last_modified or expires_at):
+            return
+
+        path = os.path.join(self.cache_dir, hashlib.sha256(url.encode()).hexdigest())
+        # A private temp file per writer, so overlapping fetches of one URL can't clobber each other
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute('''
+                    INSERT OR REPLACE INTO entries (
+                        url, path, etag, last_modified, expires_at, size, last_access
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (url, path, etag, last_modified, expires_at, len(data), time.time()))
+                conn.commit()
+        self._evict()
+
+    def _evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        with self.lock:
+            with sqlite3.connect(self.db_path) as conn:
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total <= self.max_bytes:
+                    return
+                evicted = []
+                for url, path, size in conn.execute(
+                        "SELECT url, path, size FROM entries ORDER BY last_access"):
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((url, path))
+                    total -= size
+                conn.executemany("DELETE FROM entries WHERE url = ?",
+                                 [(url,) for url, _ in evicted])
+                conn.commit()
+        for _, path in evicted:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _record(self, outcome: str, bytes_saved: int = 0):
+        with self.lock:
+            self._stats['requests'] += 1
+            self._stats[outcome] += 1
+            self._stats['bytes_saved'] += bytes_saved
+
+    def _prepare(self, url: str) -> Tuple[Optional[Dict], Optional[bytes], Dict[str, str]]:
+        """Return (entry, fresh bytes, conditional headers) for a fetch of `url`"""
+        entry = self._lookup(url)
+        if entry is None:
+            return None, None, {}
+        if entry['expires_at'] is not None and entry['expires_at'] > time.time():
+            data = self._read(entry)
+            if data is not None:
+                self._record('hits', len(data))
+                return entry, data, {}
+            return None, None, {}
+
+        headers = {}
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+        return entry, None, headers
+
+    def _complete(self, url: str, entry: Optional[Dict], status_code: int,
+                  headers: Mapping[str, str], content: bytes) -> Optional[bytes]:
+        """Handle a (conditional) response; None means the cached copy vanished and a refetch is needed"""
+        if status_code == 304 and entry is not None:
+            data = self._read(entry)
+            if data is None:
+                return None
+            _, expires_at = self._expiry(headers)
+            with self.lock:
+                with sqlite3.connect(self.db_path) as conn:
+                    conn.execute("UPDATE entries SET expires_at = ? WHERE url = ?", (expires_at, url))
+                    conn.commit()
+            self._record('revalidated', len(data))
+            return data
+
+        self._record('misses')
+        self._store(url, content, headers)
+        return content
+
+    def fetch(self, url: str, timeout: Optional[float] = None) -> bytes:
+        """Return the bytes at `url`, from the cache when it is fresh or still valid"""
+        entry, data, headers = self._prepare(url)
+        if data is not None:
+            return data
+        response = requests.get(url, headers=headers, timeout=timeout)
+        if response.status_code != 304:
+            response.raise_for_status()
+        data = self._complete(url, entry, response.status_code, response.headers, response.content)
+        if data is None:
+            response = requests.get(url, timeout=timeout)
+            response.raise_for_status()
+            data = self._complete(url, None, response.status_code, response.headers, response.content)
+        return data
+
+    async def afetch(self, url: str, client: httpx.AsyncClient,
+                     timeout: Optional[float] = None) -> bytes:
+        """Async version of `fetch` using a shared httpx client.
+
+        The SQLite index and file reads and writes run in the default executor
+        so a busy cache never stalls the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        entry, data, headers = await loop.run_in_executor(None, self._prepare, url)
+        if data is not None:
+            return data
+        response = await client.get(url, headers=headers, timeout=timeout)
+        if response.status_code != 304:
+            response.raise_for_status()
+        data = await loop.run_in_executor(
+            None, self._complete, url, entry, response.status_code, response.headers, response.content
+        )
+        if data is None:
+            response = await client.get(url, timeout=timeout)
+            response.raise_for_status()
+            data = await loop.run_in_executor(
+                None, self._complete, url, None, response.status_code, response.headers, response.content
+            )
+        return data
+
+    def stats(self) -> Dict:
+        """Return request counts, hit ratio and bytes saved since start-up"""
+        with self.lock:
+            stats = dict(self._stats)
+        served = stats['hits'] + stats['revalidated']
+        stats['hit_ratio'] = served / stats['requests'] if stats['requests'] else 0.0
+        return stats
@@ -0,0 +1,91 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PIL import Image
+
+from img_pro import ImageProcessor
+from http_cache import DiskImageCache
+from deadline import Deadline
+
+
+class ImageHandle:
+    """A decoded image together with a lazily built preview thumbnail"""
+
+    def __init__(self, key: str, image: Image.Image, thumbnail_size: Tuple[int, int]):
+        self.key = key
+        self.image = image
+        self.thumbnail_size = thumbnail_size
+        self._thumbnail = None
+
+    def thumbnail(self) -> Image.Image:
+        """Return a downscaled copy of the image for rendering previews"""
+        if self._thumbnail is None:
+            thumb = self.image.copy()
+            thumb.thumbnail(self.thumbnail_size)
+            self._thumbnail = thumb
+        return self._thumbnail
+
+
+class ImageHandleCache:
+    """Per-session LRU cache of decoded images keyed by URL or upload digest.
+
+    Lets the preview and the analysis share one download and decode of the
+    same input across Streamlit reruns.
+    """
+
+    def __init__(self, max_entries: int = 8, thumbnail_size: Tuple[int, int] = (640, 640),
+                 http_cache: Optional[DiskImageCache] = None):
+        self.http_cache = http_cache
+        self.max_entries = max_entries
+        self.thumbnail_size = thumbnail_size
+        self.lock = threading.Lock()
+        self._handles = OrderedDict()
+
+    @staticmethod
+    def key_for(image_input) -> str:
+        """Build a cache key from a URL or the digest of an uploaded file's bytes"""
+        if isinstance(image_input, str):
+            prefix = "url" if image_input.startswith(('http://', 'https://')) else "path"
+            return f"{prefix}:{image_input}"
+        if hasattr(image_input, 'getvalue'):
+            data = image_input.getvalue()
+        else:
+            position = image_input.tell()
+            data = image_input.read()
+            image_input.seek(position)
+        return f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+    def lookup(self, key: str) -> Optional[ImageHandle]:
+        """Return the cached handle for `key`, marking it most recently used"""
+        with self.lock:
+            handle = self._handles.get(key)
+            if handle is not None:
+                self._handles.move_to_end(key)
+            return handle
+
+    def store(self, key: str, image: Image.Image) -> ImageHandle:
+        """Cache a decoded image under `key`, evicting the least recently used entries"""
+        handle = ImageHandle(key, image, self.thumbnail_size)
+        with self.lock:
+            self._handles[key] = handle
+            self._handles.move_to_end(key)
+            while len(self._handles) > self.max_entries:
+                self._handles.popitem(last=False)
+        return handle
+
+    def get(self, image_input, deadline: Optional[Deadline] = None) -> ImageHandle:
+        """Return the handle for a URL or file upload, loading it on a miss"""
+        key = self.key_for(image_input)
+        handle = self.lookup(key)
+        if handle is not None:
+            return handle
+
+        if key.startswith("url:"):
+            image = ImageProcessor.load_image_from_url(image_input, self.http_cache, deadline)
+        else:
+            image = ImageProcessor.load_image_from_file(image_input)
+            # Decode now so the handle does not depend on the upload's file position
+            image.load()
+        return self.store(key, image)
@@ -1,13 +1,28 @@
-from typing import Dict
+import asyncio
+from typing import Any, Dict, Hashable, Iterator, List, Tuple
 import google.generativeai as genai
+import httpx
+from PIL import Image
 
 from cap_chain import CaptioningChain
 from img_pro import ImageProcessor
+from image_cache import ImageHandleCache
+from http_cache import DiskImageCache
+from event_loop import get_event_loop
+from analysis_plan import AnalysisPlan
+from deadline import Cancelled, Deadline, DeadlineExceeded, wait_for_deadline
+from scheduler import INTERACTIVE, RequestScheduler
 
 
 class ImageCaptioningSystem:
-    def __init__(self, gemini_key1: str, gemini_key2: str):
-        """Initialize the system with two separate Gemini Vision models"""
+    def __init__(self, gemini_key1: str, gemini_key2: str, max_concurrency: int = 8,
+                 http_cache: DiskImageCache = None, reserved_interactive: int = 2,
+                 requests_per_minute: int = 15):
+        """Initialize the system with two separate Gemini Vision models.
+        
+        `max_concurrency` and `requests_per_minute` describe the quota of each
+        key; the shared scheduler is sized for both keys together.
+        """
         try:
             # Initialize first Gemini configuration and model
             genai.configure(api_key=gemini_key1)
@@ -22,25 +37,128 @@ class ImageCaptioningSystem:
             # Reset to first key as default
             genai.configure(api_key=gemini_key1)
             
+            # Every model request on these keys is admitted through one scheduler
+            self.scheduler = RequestScheduler(
+                capacity=2 * max_concurrency,
+                reserved=reserved_interactive,
+                requests_per_minute=2 * requests_per_minute
+            )
+            
             # Initialize components
-            self.chain = CaptioningChain(self.model1, self.model2)
+            self.chain = CaptioningChain(self.model1, self.model2, self.scheduler)
             self.image_processor = ImageProcessor()
+            self.http_cache = http_cache
+            
+            # Async clients live on the shared background loop and are created there lazily
+            self._loop = get_event_loop()
+            self._http_client = None
             
         except Exception as e:
             raise Exception(f"Failed to initialize Gemini models: {str(e)}")
 
-    def process_image(self, image_input) -> Dict[str, str]:
+    def _load_image(self, image_input, image_cache: ImageHandleCache = None,
+                    deadline: Deadline = None):
+        """Load an image from either a URL or a file upload, reusing `image_cache` when given"""
+        if image_cache is not None:
+            return image_cache.get(image_input, deadline).image
+        if isinstance(image_input, str) and image_input.startswith(('http://', 'https://')):
+            return self.image_processor.load_image_from_url(image_input, self.http_cache, deadline)
+        return self.image_processor.load_image_from_file(image_input)
+
+    def process_image(self, image_input, image_cache: ImageHandleCache = None,
+                      plan: AnalysisPlan = None, deadline: Deadline = None,
+                      priority: str = INTERACTIVE) -> Dict[str, str]:
         """Process image from either URL or file with enhanced error handling"""
+        return self._loop.run(self.aprocess_image(image_input, image_cache, plan, deadline, priority))
+
+    def analyze_image(self, image: Image.Image, plan: AnalysisPlan = None,
+                      deadline: Deadline = None, priority: str = INTERACTIVE) -> Dict[str, str]:
+        """Run the captioning chain on an already decoded image"""
+        return self._loop.run(self.aanalyze_image(image, plan, deadline, priority))
+
+    def analyze_images(self, images: List[Tuple[Hashable, Image.Image]],
+                       plan: AnalysisPlan = None, deadline: Deadline = None,
+                       priority: str = INTERACTIVE) -> Dict[Hashable, Any]:
+        """Analyze several decoded images in one packed request; see `CaptioningChain.acall_packed`"""
+        return self._loop.run(self.aanalyze_images(images, plan, deadline, priority))
+
+    def stream_image(self, image_input, image_cache: ImageHandleCache = None,
+                     plan: AnalysisPlan = None, deadline: Deadline = None,
+                     priority: str = INTERACTIVE) -> Iterator[Tuple[str, str]]:
+        """Process image like `process_image`, yielding (component, text chunk) pairs as they arrive"""
         try:
-            # Load and process image
-            if isinstance(image_input, str) and image_input.startswith(('http://', 'https://')):
-                image = self.image_processor.load_image_from_url(image_input)
-            else:
-                image = self.image_processor.load_image_from_file(image_input)
-            
-            # Generate analysis components
-            components = self.chain({"image": image})
-            return components
-            
+            image = self._load_image(image_input, image_cache, deadline)
+            yield from self.chain.stream(
+                {"image": image, "plan": plan, "deadline": deadline, "priority": priority}
+            )
+        except (DeadlineExceeded, Cancelled):
+            raise
         except Exception as e:
             raise Exception(f"Image processing failed: {str(e)}")
+
+    def _get_http_client(self) -> httpx.AsyncClient:
+        """Return the pooled async HTTP client used for downloads"""
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(follow_redirects=True)
+        return self._http_client
+
+    async def _aload_image(self, image_input, image_cache: ImageHandleCache = None,
+                           deadline: Deadline = None):
+        """Async counterpart of `_load_image`; decoding runs in the default executor"""
+        loop = asyncio.get_running_loop()
+        if not (isinstance(image_input, str) and image_input.startswith(('http://', 'https://'))):
+            return await loop.run_in_executor(None, self._load_image, image_input, image_cache, deadline)
+
+        key = None
+        if image_cache is not None:
+            key = image_cache.key_for(image_input)
+            handle = image_cache.lookup(key)
+            if handle is not None:
+                return handle.image
+
+        stage = deadline.stage() if deadline else None
+        data = await wait_for_deadline(
+            self.image_processor.adownload_image_bytes(
+                image_input, self._get_http_client(), self.http_cache, stage
+            ),
+            stage
+        )
+        stage = deadline.stage() if deadline else None
+        image = await loop.run_in_executor(None, self.image_processor.decode_image, data, stage)
+        if image_cache is not None:
+            image_cache.store(key, image)
+        return image
+
+    async def aprocess_image(self, image_input, image_cache: ImageHandleCache = None,
+                             plan: AnalysisPlan = None, deadline: Deadline = None,
+                             priority: str = INTERACTIVE) -> Dict[str, str]:
+        """Async version of `process_image`, sharing the models and caches with the sync API"""
+        try:
+            # Loading holds no scheduler slot; slots are taken per model request
+            image = await self._aload_image(image_input, image_cache, deadline)
+            return await self.chain.acall(
+                {"image": image, "plan": plan, "deadline": deadline, "priority": priority}
+            )
+        except (DeadlineExceeded, Cancelled):
+            raise
+        except Exception as e:
+            raise Exception(f"Image processing failed: {str(e)}")
+
+    async def aanalyze_image(self, image: Image.Image, plan: AnalysisPlan = None,
+                             deadline: Deadline = None, priority: str = INTERACTIVE) -> Dict[str, str]:
+        """Async version of `analyze_image`"""
+        return await self.chain.acall(
+            {"image": image, "plan": plan, "deadline": deadline, "priority": priority}
+        )
+
+    async def aanalyze_images(self, images: List[Tuple[Hashable, Image.Image]],
+                              plan: AnalysisPlan = None, deadline: Deadline = None,
+                              priority: str = INTERACTIVE) -> Dict[Hashable, Any]:
+        """Async version of `analyze_images`"""
+        return await self.chain.acall_packed(images, plan, deadline, priority)
+
+    async def aclose(self):
+        """Close the pooled HTTP client"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
@@ -1,14 +1,61 @@
 from PIL import Image
+import httpx
 import requests
 from io import BytesIO
 import base64
 
+from http_cache import DiskImageCache
+from deadline import Deadline
+
+# Seconds a download may take when no deadline bounds it
+DOWNLOAD_TIMEOUT = 30.0
+
+def _download_timeout(deadline: Deadline = None) -> float:
+    """Remaining time on `deadline`, or DOWNLOAD_TIMEOUT when it is absent or unbounded"""
+    timeout = deadline.timeout() if deadline else None
+    return DOWNLOAD_TIMEOUT if timeout is None else timeout
+
 class ImageProcessor:
     @staticmethod
-    def load_image_from_url(url: str) -> Image.Image:
+    def download_image_bytes(url: str, cache: DiskImageCache = None,
+                             deadline: Deadline = None) -> bytes:
+        """Download the raw bytes of an image from a URL, through `cache` when given"""
+        timeout = _download_timeout(deadline)
+        if cache is not None:
+            return cache.fetch(url, timeout)
+        response = requests.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.content
+
+    @staticmethod
+    async def adownload_image_bytes(url: str, client: httpx.AsyncClient,
+                                    cache: DiskImageCache = None,
+                                    deadline: Deadline = None) -> bytes:
+        """Download the raw bytes of an image from a URL without blocking the event loop"""
+        timeout = _download_timeout(deadline)
+        if cache is not None:
+            return await cache.afetch(url, client, timeout)
+        response = await client.get(url, timeout=timeout)
+        response.raise_for_status()
+        return response.content
+
+    @staticmethod
+    def decode_image(data: bytes, deadline: Deadline = None) -> Image.Image:
+        """Decode raw image bytes into a fully loaded PIL Image"""
+        if deadline:
+            deadline.check()
+        image = Image.open(BytesIO(data))
+        # Force decoding now so the encoded buffer can be released
+        image.load()
+        return image
+
+    @staticmethod
+    def load_image_from_url(url: str, cache: DiskImageCache = None,
+                            deadline: Deadline = None) -> Image.Image:
         """Load an image from a URL"""
-        response = requests.get(url)
-        return Image.open(BytesIO(response.content))
+        download_deadline = deadline.stage() if deadline else None
+        data = ImageProcessor.download_image_bytes(url, cache, download_deadline)
+        return ImageProcessor.decode_image(data, deadline.stage() if deadline else None)
 
     @staticmethod
     def load_image_from_file(file) -> Image.Image:
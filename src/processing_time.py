@@ -18,6 +18,11 @@ class ProcessingTimeTracker:
                 'session_start': datetime.now(),
                 'failures': 0
             }
+        if 'first_text_times' not in st.session_state:
+            st.session_state.first_text_times = {
+                'single': [],
+                'url': []
+            }
     
     def start_operation(self):
         """Start timing an operation"""
@@ -30,9 +35,23 @@ class ProcessingTimeTracker:
         st.session_state.processing_stats['total_processed'] += 1
         return duration
     
+    def record_first_text(self, start_time, category):
+        """Record the time until the first streamed text of an operation arrived"""
+        duration = time.time() - start_time
+        st.session_state.first_text_times[category].append(duration)
+        return duration
+    
+    def get_first_text_stats(self, category):
+        """Calculate time-to-first-text statistics for a specific category"""
+        return self._summarize(st.session_state.first_text_times[category])
+    
     def get_stats(self, category):
         """Calculate statistics for a specific category"""
-        times = st.session_state.processing_times[category]
+        return self._summarize(st.session_state.processing_times[category])
+    
+    @staticmethod
+    def _summarize(times):
+        """Summarize a list of durations"""
         if not times:
             return {
                 'avg': 0,
@@ -65,6 +84,13 @@ class ProcessingTimeTracker:
         col3.metric("Success Rate", 
                    f"{((stats['count'] - st.session_state.processing_stats['failures']) / max(stats['count'], 1) * 100):.1f}%",
                    f"{stats['count']} total")
+        
+        if category in st.session_state.first_text_times:
+            first_text = self.get_first_text_stats(category)
+            if first_text['count']:
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Avg Time to First Text", f"{first_text['avg']:.2f}s")
+                col2.metric("Fastest First Text", f"{first_text['min']:.2f}s", f"Slowest: {first_text['max']:.2f}s")
     
     def display_batch_progress(self, current, total, current_time):
         """Display batch processing progress and estimates"""
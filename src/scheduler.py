@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+import numpy as np
+
+from deadline import Deadline, wait_for_deadline
+from event_loop import get_event_loop
+
+# Request classes, from most to least urgent
+INTERACTIVE = "interactive"
+BATCH = "batch"
+BACKFILL = "backfill"
+PRIORITIES = {INTERACTIVE: 0, BATCH: 1, BACKFILL: 2}
+
+
+class RequestScheduler:
+    """Priority-aware admission control in front of the models.
+
+    Every model request takes one slot. At most `capacity` requests run at
+    once and, when `requests_per_minute` is set, at most that many start in
+    any 60 second window, matching the keys' request quota. Waiting requests
+    are admitted strictly by class, then in arrival order, so an interactive
+    request jumps ahead of every queued batch or backfill request.
+    `reserved` slots, and the same share of the per-minute quota, can only
+    be used by interactive work, which keeps room for it even while a large
+    batch saturates the rest.
+
+    `acquire`, `release` and `slot` must run on the event loop; `hold` is
+    for synchronous callers on other threads and `metrics` may be called
+    from any thread.
+    """
+
+    def __init__(self, capacity: int = 8, reserved: int = 2,
+                 requests_per_minute: Optional[int] = None, window: int = 500):
+        if not 0 <= reserved < capacity:
+            raise ValueError("reserved must be at least 0 and below capacity")
+        self.capacity = capacity
+        self.reserved = reserved
+        self.requests_per_minute = requests_per_minute
+        self.lock = threading.Lock()
+        self._in_use = {name: 0 for name in PRIORITIES}
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._started = deque()
+        self._loop = None
+        self._timer = None
+        self._admitted = {name: 0 for name in PRIORITIES}
+        self._wait_times = {name: deque(maxlen=window) for name in PRIORITIES}
+
+    def limit(self, priority: str) -> int:
+        """Number of concurrent requests the given class may use"""
+        return self.capacity if priority == INTERACTIVE else self.capacity - self.reserved
+
+    def _rate_limit(self, priority: str) -> Optional[int]:
+        if self.requests_per_minute is None or priority == INTERACTIVE:
+            return self.requests_per_minute
+        return max(1, self.requests_per_minute * self.limit(priority) // self.capacity)
+
+    def _rate_delay(self, priority: str) -> float:
+        """Seconds until the class may start another request under the rate limit; caller holds the lock"""
+        rate_limit = self._rate_limit(priority)
+        if rate_limit is None:
+            return 0.0
+        now = time.monotonic()
+        while self._started and now - self._started[0] >= 60:
+            self._started.popleft()
+        if len(self._started) < rate_limit:
+            return 0.0
+        return self._started[len(self._started) - rate_limit] + 60 - now
+
+    def _can_admit(self, priority: str) -> bool:
+        return sum(self._in_use.values()) < self.limit(priority) and self._rate_delay(priority) == 0
+
+    def _admit(self, priority: str, enqueued_at: float):
+        self._in_use[priority] += 1
+        self._admitted[priority] += 1
+        self._started.append(time.monotonic())
+        self._wait_times[priority].append(time.monotonic() - enqueued_at)
+
+    def _wake(self):
+        with self.lock:
+            self._timer = None
+            self._dispatch()
+
+    def _dispatch(self):
+        """Admit queued requests in priority order while capacity allows; caller holds the lock"""
+        while self._waiters:
+            rank, _, priority, enqueued_at, future, _ = self._waiters[0]
+            if future.done():
+                # Abandoned by a caller whose deadline passed or who was cancelled
+                heapq.heappop(self._waiters)
+                continue
+            # Lower classes have stricter limits, so if the head can't run nothing can
+            if not self._can_admit(priority):
+                delay = self._rate_delay(priority)
+                # Nothing releases a slot when only the rate limit blocks, so wake up for it
+                if delay > 0 and (self._timer is None or
+                                  self._timer.when() > self._loop.time() + delay):
+                    if self._timer is not None:
+                        self._timer.cancel()
+                    self._timer = self._loop.call_later(delay, self._wake)
+                break
+            heapq.heappop(self._waiters)
+            self._admit(priority, enqueued_at)
+            future.set_result(priority)
+
+    async def acquire(self, priority: str = INTERACTIVE, ticket: Optional[object] = None):
+        """
+        Wait for a slot for a request of the given class.
+
+        Returns:
+            priority: the class the slot was granted under, which differs from
+            `priority` if the request was promoted while queued (see `promote`)
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        enqueued_at = time.monotonic()
+        with self.lock:
+            queued_ahead = any(
+                not waiter[4].done() and waiter[0] <= PRIORITIES[priority]
+                for waiter in self._waiters
+            )
+            if not queued_ahead and self._can_admit(priority):
+                self._admit(priority, enqueued_at)
+                return priority
+            self._loop = asyncio.get_running_loop()
+            future = self._loop.create_future()
+            heapq.heappush(self._waiters, (
+                PRIORITIES[priority], next(self._sequence), priority, enqueued_at, future, ticket
+            ))
+            self._dispatch()
+
+        try:
+            return await future
+        except asyncio.CancelledError:
+            # The slot may have been granted just as the caller gave up
+            if future.done() and not future.cancelled():
+                self.release(future.result())
+            raise
+
+    def release(self, priority: str = INTERACTIVE):
+        """Return a slot and admit the next queued requests"""
+        with self.lock:
+            self._in_use[priority] -= 1
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = INTERACTIVE, deadline: Optional[Deadline] = None,
+                   ticket: Optional[object] = None):
+        """Hold a slot for the duration of the block; time spent queued counts against `deadline`"""
+        granted = await wait_for_deadline(self.acquire(priority, ticket), deadline)
+        try:
+            yield
+        finally:
+            self.release(granted)
+
+    @contextmanager
+    def hold(self, priority: str = INTERACTIVE, deadline: Optional[Deadline] = None):
+        """Blocking version of `slot` for synchronous callers outside the event loop"""
+        loop = get_event_loop()
+        granted = loop.run(wait_for_deadline(self.acquire(priority), deadline))
+        try:
+            yield
+        finally:
+            loop.loop.call_soon_threadsafe(self.release, granted)
+
+    def _redispatch(self):
+        with self.lock:
+            self._dispatch()
+
+    def promote(self, ticket: object, priority: str = INTERACTIVE) -> bool:
+        """
+        Move queued requests acquired with `ticket` up to `priority`, keeping their place in line.
+
+        Returns:
+            promoted: True if such a request was waiting for a slot
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority class: {priority}")
+        with self.lock:
+            promoted = False
+            for index, (rank, seq, current, enqueued_at, future, owner) in enumerate(self._waiters):
+                if owner is ticket and not future.done() and rank > PRIORITIES[priority]:
+                    self._waiters[index] = (
+                        PRIORITIES[priority], seq, priority, enqueued_at, future, owner
+                    )
+                    promoted = True
+            if not promoted:
+                return False
+            heapq.heapify(self._waiters)
+            loop = self._loop
+        # Futures are resolved on the loop thread, so admit from there
+        loop.call_soon_threadsafe(self._redispatch)
+        return True
+
+    def metrics(self) -> Dict[str, Dict]:
+        """Queue depth, running requests and wait-time percentiles per class"""
+        with self.lock:
+            depth = {name: 0 for name in PRIORITIES}
+            for waiter in self._waiters:
+                if not waiter[4].done():
+                    depth[waiter[2]] += 1
+            metrics = {}
+            for name in PRIORITIES:
+                waits = list(self._wait_times[name])
+                metrics[name] = {
+                    'queue_depth': depth[name],
+                    'running': self._in_use[name],
+                    'admitted': self._admitted[name],
+                    'wait_p50': float(np.percentile(waits, 50)) if waits else 0.0,
+                    'wait_p95': float(np.percentile(waits, 95)) if waits else 0.0,
+                }
+        return metrics
@@ -6,6 +6,8 @@ import uuid
 from typing import Dict, Optional, List
 import os
 
+from exporters import export_chunks
+
 class SessionManager:
     """Manages session data and database operations for the image captioning system."""
     
@@ -115,33 +117,46 @@ class SessionManager:
                     return dict(zip(columns, result))
                 return None
     
-    def export_to_excel(self, output_path: str = "session_data.xlsx"):
-        """Export the database contents to an Excel file."""
+    # Database columns renamed to match the client template on export
+    EXPORT_COLUMNS = {
+        'original_order': 'Original Order',
+        'content_id': 'Content ID',
+        'stock_url': 'Stock URL',
+        'caption_summary': 'Caption Summary',
+        'subject_people_objects': 'Subject - People & Objects',
+        'subject_environment': 'Subject - Environment',
+        'creative_technical_elements': 'Creative & Technical Elements'
+    }
+    
+    def export(self, output_path: str, fmt: str = 'xlsx', chunksize: int = 10000) -> str:
+        """
+        Export the database contents, streaming rows in chunks.
+        
+        Args:
+            output_path: Destination file
+            fmt: One of 'xlsx', 'parquet', 'csv' or 'jsonl'
+            chunksize: Number of rows read and written at a time
+            
+        Returns:
+            The path that was written
+        """
         with self.lock:
             try:
                 with sqlite3.connect(self.db_path) as conn:
                     query = "SELECT * FROM sessions ORDER BY created_at"
-                    df = pd.read_sql_query(query, conn)
-                    
-                    # Rename columns to match client template
-                    df = df.rename(columns={
-                        'original_order': 'Original Order',
-                        'content_id': 'Content ID',
-                        'stock_url': 'Stock URL',
-                        'caption_summary': 'Caption Summary',
-                        'subject_people_objects': 'Subject - People & Objects',
-                        'subject_environment': 'Subject - Environment',
-                        'creative_technical_elements': 'Creative & Technical Elements'
-                    })
-                    
-                    # Remove internal columns not needed in export
-                    df = df.drop(['id', 'created_at'], axis=1, errors='ignore')
-                    
-                    # Export to Excel
-                    df.to_excel(output_path, index=False, engine='openpyxl')
-                    return output_path
+                    chunks = (
+                        # Remove internal columns not needed in export
+                        chunk.rename(columns=self.EXPORT_COLUMNS)
+                             .drop(['id', 'created_at'], axis=1, errors='ignore')
+                        for chunk in pd.read_sql_query(query, conn, chunksize=chunksize)
+                    )
+                    return export_chunks(chunks, output_path, fmt)
             except Exception as e:
-                raise Exception(f"Failed to export to Excel: {str(e)}")
+                raise Exception(f"Failed to export to {fmt}: {str(e)}")
+    
+    def export_to_excel(self, output_path: str = "session_data.xlsx"):
+        """Export the database contents to an Excel file."""
+        return self.export(output_path, 'xlsx')
     
     def reset_database(self):
         """Clear all session data and reinitialize the database."""
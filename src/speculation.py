@@ -0,0 +1,159 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Optional
+
+from PIL import Image
+
+from analysis_plan import AnalysisPlan
+from deadline import Deadline
+from event_loop import get_event_loop
+from scheduler import BACKFILL, INTERACTIVE, PRIORITIES
+
+
+class SpeculativeAnalyzer:
+    """Starts single-image analysis in the background as soon as a preview loads.
+
+    Results are keyed by the image cache key (URL or upload digest) and the
+    plan, so clicking "Analyze" either returns a finished result at once or
+    waits on the speculation already in flight. Speculations run as BACKFILL
+    on the shared scheduler and are only started while nothing else is
+    queued, at most `max_in_flight` at a time and `max_per_minute` per
+    minute, to keep guesses from eating into the quota.
+    """
+
+    def __init__(self, captioning_system, max_in_flight: int = 2, max_per_minute: int = 10,
+                 max_results: int = 32, timeout: Optional[float] = 120.0,
+                 stage_timeout: Optional[float] = 60.0):
+        self.captioning_system = captioning_system
+        self.max_in_flight = max_in_flight
+        self.max_per_minute = max_per_minute
+        self.max_results = max_results
+        self.timeout = timeout
+        self.stage_timeout = stage_timeout
+        self.lock = threading.Lock()
+        self._loop = get_event_loop()
+        self._entries = OrderedDict()
+        self._started_at = deque()
+        self._stats = {
+            'started': 0,
+            'skipped': 0,
+            'used': 0,
+            'wasted': 0,
+            'hits': 0,
+            'attached': 0,
+            'misses': 0
+        }
+
+    @staticmethod
+    def key_for(image_key: str, plan: AnalysisPlan) -> str:
+        """Combine an image cache key with the plan the result was produced for"""
+        return f"{image_key}|{plan.cache_key}"
+
+    def _queue_busy(self) -> bool:
+        metrics = self.captioning_system.scheduler.metrics()
+        return any(metrics[name]['queue_depth'] for name in PRIORITIES)
+
+    def _within_budget(self) -> bool:
+        """Whether another speculation fits in the per-minute budget; caller holds the lock"""
+        now = time.monotonic()
+        while self._started_at and now - self._started_at[0] > 60:
+            self._started_at.popleft()
+        return len(self._started_at) < self.max_per_minute
+
+    def _discard(self, entry: Dict):
+        """Drop an entry, cancelling it if still running; caller holds the lock"""
+        if not entry['used']:
+            self._stats['wasted'] += 1
+        entry['future'].cancel()
+
+    async def _run(self, inputs: Dict):
+        return await self.captioning_system.chain.acall(inputs)
+
+    def speculate(self, image_key: str, image: Image.Image, plan: AnalysisPlan) -> bool:
+        """
+        Start analyzing `image` with `plan` in the background unless a limit applies.
+
+        Returns:
+            started: True if a new speculation was started
+        """
+        key = self.key_for(image_key, plan)
+        with self.lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return False
+
+            # A new plan for an image means the settings changed; the old guess is stale
+            for stale_key, entry in list(self._entries.items()):
+                if entry['image_key'] == image_key and not entry['future'].done():
+                    self._discard(self._entries.pop(stale_key))
+
+            in_flight = sum(1 for entry in self._entries.values() if not entry['future'].done())
+            if in_flight >= self.max_in_flight or not self._within_budget() or self._queue_busy():
+                self._stats['skipped'] += 1
+                return False
+
+            # The chain reads the priority before each request, so a claim can promote it
+            # The ticket lets a claim promote the request this speculation has queued
+            inputs = {"image": image, "plan": plan, "priority": BACKFILL, "ticket": object(),
+                      "deadline": Deadline(self.timeout, self.stage_timeout)}
+            entry = {'image_key': image_key, 'inputs': inputs, 'used': False,
+                     'started_at': time.monotonic()}
+            entry['future'] = self._loop.submit(self._run(inputs))
+            self._entries[key] = entry
+            self._started_at.append(time.monotonic())
+            self._stats['started'] += 1
+            while len(self._entries) > self.max_results:
+                self._discard(self._entries.popitem(last=False)[1])
+            return True
+
+    def claim(self, image_key: str, plan: AnalysisPlan, deadline: Optional[Deadline] = None,
+              clicked_at: Optional[float] = None) -> Optional[Dict[str, str]]:
+        """
+        Return the speculative result for `image_key` and `plan`, waiting if it is still running.
+
+        Only speculations started before `clicked_at` (a `time.monotonic()`
+        value) are used. Returns None when there is no usable speculation, in
+        which case the caller runs the analysis itself at interactive priority.
+        """
+        key = self.key_for(image_key, plan)
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is not None and clicked_at is not None and entry['started_at'] > clicked_at:
+                # Started by the click itself, so it predicted nothing
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            ready = entry['future'].done()
+            # The user is now waiting on the remaining requests, including one queued as backfill
+            entry['inputs']['priority'] = INTERACTIVE
+            if not ready:
+                self.captioning_system.scheduler.promote(entry['inputs']['ticket'], INTERACTIVE)
+
+        try:
+            result = entry['future'].result(deadline.remaining() if deadline else None)
+        except Exception:
+            # Failed, cancelled or out of time; fall back to a regular request
+            with self.lock:
+                if self._entries.get(key) is entry:
+                    self._discard(self._entries.pop(key))
+                self._stats['misses'] += 1
+            return None
+
+        with self.lock:
+            if not entry['used']:
+                entry['used'] = True
+                self._stats['used'] += 1
+            self._stats['hits' if ready else 'attached'] += 1
+        return result
+
+    def stats(self) -> Dict:
+        """Return speculation counts and hit rates since start-up"""
+        with self.lock:
+            stats = dict(self._stats)
+        clicks = stats['hits'] + stats['attached'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['attached']) / clicks if clicks else 0.0
+        stats['use_rate'] = stats['used'] / stats['started'] if stats['started'] else 0.0
+        return stats
@@ -0,0 +1,66 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Modules in src import each other top-level, the same way app.py loads them
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+
+class ImageServer:
+    """Local HTTP server serving fixed bytes with configurable cache headers"""
+
+    def __init__(self, body=b"image-bytes", etag='"v1"', cache_control=None):
+        self.body = body
+        self.etag = etag
+        self.cache_control = cache_control
+        self.full_responses = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if server.etag and self.headers.get('If-None-Match') == server.etag:
+                    with server.lock:
+                        server.not_modified += 1
+                    self.send_response(304)
+                    self._cache_headers()
+                    self.end_headers()
+                    return
+                with server.lock:
+                    server.full_responses += 1
+                self.send_response(200)
+                self._cache_headers()
+                self.send_header('Content-Length', str(len(server.body)))
+                self.end_headers()
+                self.wfile.write(server.body)
+
+            def _cache_headers(self):
+                if server.etag:
+                    self.send_header('ETag', server.etag)
+                if server.cache_control:
+                    self.send_header('Cache-Control', server.cache_control)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def url(self, path="/image.jpg"):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}{path}"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = ImageServer()
+    yield server
+    server.close()
@@ -0,0 +1,19 @@
+from batch_jobs import BatchJob, BatchJobManager
+
+
+def test_jobs_are_scoped_to_owners_and_can_be_reattached():
+    manager = BatchJobManager()
+    job = BatchJob("job-1", "sheet", 3, 'csv', owner="first")
+    manager._jobs[job.job_id] = job
+
+    assert [snapshot['job_id'] for snapshot in manager.list_jobs("first")] == ["job-1"]
+    assert manager.list_jobs("second") == []
+    assert not manager.cancel("job-1", "second")
+
+    # A new session joins the job by its id
+    assert manager.attach(" job-1 ", "second")
+    assert not manager.attach("unknown", "second")
+    assert manager.get("job-1", "second") is job
+    assert manager.has_active_jobs("second")
+    assert manager.cancel("job-1", "second")
+    assert job.token.cancelled
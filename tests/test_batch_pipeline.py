@@ -0,0 +1,175 @@
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from batch_pipeline import BatchPipeline, ResultSpool
+from deadline import CancellationToken, DeadlineExceeded
+from scheduler import RequestScheduler
+
+
+def png_bytes():
+    buffer = io.BytesIO()
+    Image.new("RGB", (4, 4), "red").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def png_server(server):
+    server.body = png_bytes()
+    return server
+
+
+class FakeCaptioningSystem:
+    """Captions instantly unless told to wait, fail or time out for given rows"""
+
+    def __init__(self, delay=0.0, fail=(), timeout=()):
+        self.http_cache = None
+        self.scheduler = RequestScheduler(capacity=2, reserved=1)
+        self.delay = delay
+        self.fail = set(fail)
+        self.timeout = set(timeout)
+
+    def _caption(self, image, deadline):
+        time.sleep(self.delay)
+        marker = image.info.get('row')
+        if marker in self.timeout:
+            raise DeadlineExceeded("Deadline exceeded")
+        if marker in self.fail:
+            raise Exception("Image analysis failed: boom")
+        return {'base_description': "caption"}
+
+    def analyze_image(self, image, plan=None, deadline=None, priority=None):
+        return self._caption(image, deadline)
+
+    def analyze_images(self, images, plan=None, deadline=None, priority=None):
+        results = {}
+        for image_id, image in images:
+            try:
+                results[image_id] = self._caption(image, deadline)
+            except Exception as e:
+                results[image_id] = e
+        return results
+
+
+def rows(server, count):
+    for index in range(count):
+        yield {'content_id': index, 'url': server.url(f"/{index}.png")}
+
+
+def run_pipeline(pipeline, row_iter, token=None, on_result=None):
+    spool = ResultSpool()
+    try:
+        stats = pipeline.run(row_iter, spool, on_result, token)
+        return stats, list(spool)
+    finally:
+        spool.remove()
+
+
+def test_processes_every_row(png_server):
+    pipeline = BatchPipeline(FakeCaptioningSystem(), queue_size=2)
+    stats, results = run_pipeline(pipeline, rows(png_server, 10))
+    assert stats['processed'] == 10
+    assert sorted(result['content_id'] for result in results) == list(range(10))
+    assert all(result['base_description'] == "caption" for result in results)
+
+
+def test_caption_workers_default_to_the_batch_share_of_the_scheduler():
+    assert BatchPipeline(FakeCaptioningSystem()).caption_workers == 1
+
+
+def test_slow_captioning_applies_backpressure(png_server):
+    queue_size = 2
+    pipeline = BatchPipeline(FakeCaptioningSystem(delay=0.02), queue_size=queue_size,
+                             download_workers=1, caption_workers=1)
+    counts = {'read': 0, 'finished': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    def counted(row_iter):
+        for row in row_iter:
+            with lock:
+                counts['read'] += 1
+                counts['peak'] = max(counts['peak'], counts['read'] - counts['finished'])
+            yield row
+
+    def on_result(result):
+        with lock:
+            counts['finished'] += 1
+
+    stats, _ = run_pipeline(pipeline, counted(rows(png_server, 30)), on_result=on_result)
+    assert stats['processed'] == 30
+    # Four queues plus one item held by the reader and by each stage worker
+    assert counts['peak'] <= 4 * queue_size + 4
+
+
+def test_failures_and_timeouts_are_counted_separately(png_server):
+    pipeline = BatchPipeline(FakeCaptioningSystem(fail={1}, timeout={2}))
+    original_decode = pipeline._decode
+
+    def decode(item):
+        original_decode(item)
+        item['image'].info['row'] = item['content_id']
+
+    pipeline._decode = decode
+    finished = []
+    stats, results = run_pipeline(pipeline, rows(png_server, 5), on_result=finished.append)
+    assert (stats['processed'], stats['failed'], stats['timed_out']) == (3, 1, 1)
+    statuses = {result['content_id']: result.get('status') for result in finished}
+    assert statuses[1] == 'failed'
+    assert statuses[2] == 'timeout'
+    assert len(results) == 3
+
+
+def test_packed_rows_fail_individually(png_server):
+    pipeline = BatchPipeline(FakeCaptioningSystem(fail={3}), pack_size=4, pack_wait=0.05)
+    original_decode = pipeline._decode
+
+    def decode(item):
+        original_decode(item)
+        item['image'].info['row'] = item['content_id']
+
+    pipeline._decode = decode
+    stats, results = run_pipeline(pipeline, rows(png_server, 8))
+    assert (stats['processed'], stats['failed']) == (7, 1)
+    assert 3 not in {result['content_id'] for result in results}
+
+
+def test_cancel_stops_reading_and_keeps_finished_rows(png_server):
+    token = CancellationToken()
+    pipeline = BatchPipeline(FakeCaptioningSystem(delay=0.01), queue_size=2)
+    read = []
+
+    def tracked(row_iter):
+        for row in row_iter:
+            read.append(row['content_id'])
+            yield row
+
+    def on_result(result):
+        if 'error' not in result:
+            token.cancel()
+
+    stats, results = run_pipeline(pipeline, tracked(rows(png_server, 200)), token, on_result)
+    assert len(read) < 200
+    assert stats['cancelled'] > 0
+    assert stats['processed'] == len(results) >= 1
+    # The row read when the cancel is noticed is dropped without a result
+    accounted = stats['processed'] + stats['cancelled'] + stats['failed'] + stats['timed_out']
+    assert len(read) - 1 <= accounted <= len(read)
+
+
+def test_concurrent_caption_workers_do_not_split_packs(png_server):
+    system = FakeCaptioningSystem()
+    sizes = []
+    original = system.analyze_images
+
+    def analyze_images(images, plan=None, deadline=None, priority=None):
+        sizes.append(len(images))
+        return original(images, plan, deadline, priority)
+
+    system.analyze_images = analyze_images
+    pipeline = BatchPipeline(system, pack_size=4, pack_wait=0.5, caption_workers=8)
+    stats, _ = run_pipeline(pipeline, rows(png_server, 24))
+    assert stats['processed'] == 24
+    assert sizes == [4] * 6
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import types
+
+import pytest
+
+from analysis_plan import AnalysisPlan
+from cap_chain import CaptioningChain
+from deadline import DeadlineExceeded
+from scheduler import RequestScheduler
+
+
+def make_chain(model=None):
+    return CaptioningChain(model, model, RequestScheduler())
+
+
+PROMPTS = {'base_description': "describe", 'final_summary': "summarize"}
+
+
+def entry(text="ok"):
+    return {'base_description': text, 'final_summary': text}
+
+
+def test_parses_every_well_formed_image():
+    text = json.dumps({"1": entry("one"), "2": entry("two")})
+    parsed = make_chain()._parse_packed_response(text, 2, PROMPTS)
+    assert parsed == {1: entry("one"), 2: entry("two")}
+
+
+def test_strips_code_fences():
+    text = "```json\n" + json.dumps({"1": entry()}) + "\n```"
+    assert make_chain()._parse_packed_response(text, 1, PROMPTS) == {1: entry()}
+
+
+def test_drops_missing_and_incomplete_images():
+    text = json.dumps({
+        "1": entry(),
+        "2": {'base_description': "only one key"},
+        "3": {'base_description': " ", 'final_summary': "blank"},
+        "4": "not an object",
+    })
+    assert make_chain()._parse_packed_response(text, 5, PROMPTS) == {1: entry()}
+
+
+def test_malformed_responses_parse_to_nothing():
+    chain = make_chain()
+    assert chain._parse_packed_response("not json", 2, PROMPTS) == {}
+    assert chain._parse_packed_response("[1, 2]", 2, PROMPTS) == {}
+
+
+class PackedModel:
+    """Answers packed requests for the first image only, and single requests with plain text"""
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.single_calls = 0
+
+    async def generate_content_async(self, contents, **kwargs):
+        if 'generation_config' in kwargs:
+            return types.SimpleNamespace(text=json.dumps({"1": {key: "packed" for key in self.keys}}))
+        self.single_calls += 1
+        return types.SimpleNamespace(text="single")
+
+
+def test_only_missing_images_fall_back_to_single_requests():
+    plan = AnalysisPlan.full()
+    chain = make_chain()
+    model = PackedModel(list(chain.prompts_for(plan)))
+    chain.primary_model = chain.secondary_model = model
+
+    results = asyncio.run(chain.acall_packed([("a", None), ("b", None)], plan))
+
+    assert set(results["a"].values()) == {"packed"}
+    assert set(results["b"].values()) == {"single"}
+    assert model.single_calls == len(chain.prompts_for(plan))
+
+
+class FailingModel:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    async def generate_content_async(self, contents, **kwargs):
+        self.calls += 1
+        raise self.error
+
+
+def test_failed_packed_request_is_not_retried_per_image():
+    model = FailingModel(Exception("429 Resource exhausted"))
+    chain = make_chain(model)
+
+    results = asyncio.run(chain.acall_packed([("a", None), ("b", None)], AnalysisPlan.full()))
+
+    assert model.calls == 1
+    assert all("429" in str(results[image_id]) for image_id in ("a", "b"))
+
+
+def test_packed_deadline_is_raised_unchanged():
+    chain = make_chain(FailingModel(DeadlineExceeded("Deadline exceeded")))
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(chain.acall_packed([("a", None), ("b", None)], AnalysisPlan.full()))
@@ -0,0 +1,50 @@
+import pandas as pd
+
+from batch_pipeline import ResultSpool
+from excel_processor import ExcelProcessor
+
+
+def test_spooled_results_match_non_json_ids(tmp_path):
+    df = pd.DataFrame({
+        'content_id': [pd.Timestamp('2024-01-01'), pd.Timestamp('2024-01-02')],
+        'URL': ['https://example.com/a.jpg', 'https://example.com/b.jpg'],
+    })
+    spool = ResultSpool(str(tmp_path / "results.jsonl"))
+    spool.append({'content_id': df['content_id'][1], 'base_description': "second"})
+    spool.close()
+
+    output_file = ExcelProcessor().save_results(df, spool, str(tmp_path / "out"), 'csv')
+
+    output = pd.read_csv(output_file)
+    assert output['Base_Description'].isna()[0]
+    assert output['Base_Description'][1] == "second"
+
+
+def test_results_join_across_chunks(tmp_path):
+    df = pd.DataFrame({
+        'content_id': [1, 2, 1, 3, 4],
+        'URL': [f"https://example.com/{i}.jpg" for i in range(5)],
+    })
+    results = [
+        {'content_id': 4, 'base_description': "four", 'final_summary': "done"},
+        {'content_id': 1, 'base_description': "one"},
+        {'content_id': 99, 'base_description': "not in the sheet"},
+    ]
+
+    output_file = ExcelProcessor().save_results(df, results, str(tmp_path / "out"), 'jsonl',
+                                                chunksize=2)
+
+    output = pd.read_json(output_file, lines=True)
+    assert list(output['content_id']) == [1, 2, 1, 3, 4]
+    # Like the source sheet, only the first row with a repeated id gets the result
+    assert list(output['Base_Description'].fillna("-")) == ["one", "-", "-", "-", "four"]
+    assert output['Final_Summary'][4] == "done"
+    assert output['Final_Summary'][0] == ""
+
+
+def test_header_only_sheet_exports_all_columns(tmp_path):
+    df = pd.DataFrame({'content_id': [], 'URL': []})
+    output_file = ExcelProcessor().save_results(df, [], str(tmp_path / "out"), 'parquet')
+    output = pd.read_parquet(output_file)
+    assert output.empty
+    assert 'Final_Summary' in output.columns
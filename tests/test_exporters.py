@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from exporters import EXPORT_FORMATS, chunk_dataframe, export_chunks
+
+
+def read_back(path, fmt):
+    if fmt == 'xlsx':
+        return pd.read_excel(path)
+    if fmt == 'parquet':
+        return pd.read_parquet(path)
+    if fmt == 'csv':
+        return pd.read_csv(path)
+    return pd.read_json(path, lines=True)
+
+
+def sample(rows):
+    return pd.DataFrame({
+        'content_id': [f"item-{i}" for i in range(rows)],
+        'URL': [f"https://example.com/{i}.jpg" for i in range(rows)],
+        'Base_Description': [f"description {i}" for i in range(rows)],
+    })
+
+
+def test_chunk_dataframe_yields_the_empty_frame_once():
+    chunks = list(chunk_dataframe(sample(0)))
+    assert len(chunks) == 1
+    assert list(chunks[0].columns) == ['content_id', 'URL', 'Base_Description']
+
+
+def test_chunk_dataframe_covers_every_row():
+    chunks = list(chunk_dataframe(sample(7), chunksize=3))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+
+
+@pytest.mark.parametrize('fmt', list(EXPORT_FORMATS))
+def test_chunked_export_round_trips(tmp_path, fmt):
+    df = sample(7)
+    path = str(tmp_path / f"out{EXPORT_FORMATS[fmt]['extension']}")
+    assert export_chunks(chunk_dataframe(df, chunksize=3), path, fmt) == path
+    # For xlsx this checks the header is written once and chunks follow without gaps
+    pd.testing.assert_frame_equal(read_back(path, fmt), df)
+
+
+@pytest.mark.parametrize('fmt', ['xlsx', 'parquet', 'csv'])
+def test_empty_export_keeps_the_columns(tmp_path, fmt):
+    df = sample(0)
+    path = str(tmp_path / f"out{EXPORT_FORMATS[fmt]['extension']}")
+    export_chunks(chunk_dataframe(df), path, fmt)
+    output = read_back(path, fmt)
+    assert output.empty
+    assert list(output.columns) == list(df.columns)
+
+
+def test_empty_jsonl_export_writes_an_empty_file(tmp_path):
+    path = tmp_path / "out.jsonl"
+    export_chunks(chunk_dataframe(sample(0)), str(path), 'jsonl')
+    assert path.read_text() == ""
+
+
+@pytest.mark.parametrize('fmt', list(EXPORT_FORMATS))
+def test_no_chunks_still_writes_a_file(tmp_path, fmt):
+    path = tmp_path / f"out{EXPORT_FORMATS[fmt]['extension']}"
+    export_chunks(iter([]), str(path), fmt)
+    assert path.exists()
@@ -0,0 +1,72 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from http_cache import DiskImageCache
+
+
+def test_revalidates_with_etag(tmp_path, server):
+    cache = DiskImageCache(str(tmp_path))
+    assert cache.fetch(server.url()) == b"image-bytes"
+    assert cache.fetch(server.url()) == b"image-bytes"
+    assert server.full_responses == 1
+    assert server.not_modified == 1
+    stats = cache.stats()
+    assert stats['misses'] == 1
+    assert stats['revalidated'] == 1
+    assert stats['bytes_saved'] == len(b"image-bytes")
+
+
+def test_fresh_entries_skip_the_network(tmp_path, server):
+    server.cache_control = "max-age=3600"
+    cache = DiskImageCache(str(tmp_path))
+    cache.fetch(server.url())
+    assert cache.fetch(server.url()) == b"image-bytes"
+    assert server.full_responses == 1
+    assert server.not_modified == 0
+    assert cache.stats()['hits'] == 1
+
+
+def test_no_store_is_never_cached(tmp_path, server):
+    server.cache_control = "no-store"
+    cache = DiskImageCache(str(tmp_path))
+    cache.fetch(server.url())
+    cache.fetch(server.url())
+    assert server.full_responses == 2
+
+
+def test_evicts_least_recently_used(tmp_path, server):
+    server.body = b"x" * 100
+    cache = DiskImageCache(str(tmp_path), max_bytes=250)
+    first, second, third = server.url("/a"), server.url("/b"), server.url("/c")
+    cache.fetch(first)
+    cache.fetch(second)
+    cache.fetch(first)  # first is now more recently used than second
+    cache.fetch(third)
+    assert cache._lookup(second) is None
+    assert cache._lookup(first) is not None
+    assert cache._lookup(third) is not None
+
+
+def test_concurrent_fetches_of_one_url(tmp_path, server):
+    # Large enough that writes overlap; every miss rewrites the same entry
+    server.body = b"x" * (256 * 1024)
+    server.etag = None
+    server.cache_control = "max-age=0"
+    cache = DiskImageCache(str(tmp_path))
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(lambda _: cache.fetch(server.url()), range(200)))
+    assert results == [server.body] * 200
+    assert not [name for name in tmp_path.iterdir() if name.suffix == ".tmp"]
+
+
+def test_async_fetch_revalidates(tmp_path, server):
+    cache = DiskImageCache(str(tmp_path))
+
+    async def fetch_twice():
+        async with httpx.AsyncClient() as client:
+            return [await cache.afetch(server.url(), client) for _ in range(2)]
+
+    assert asyncio.run(fetch_twice()) == [b"image-bytes"] * 2
+    assert server.not_modified == 1
@@ -0,0 +1,145 @@
+import asyncio
+import types
+
+import pytest
+
+from analysis_plan import AnalysisPlan
+from cap_chain import CaptioningChain
+from deadline import Deadline, DeadlineExceeded
+from scheduler import BACKFILL, BATCH, INTERACTIVE, RequestScheduler
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_interactive_jumps_queued_batch_requests():
+    async def scenario():
+        scheduler = RequestScheduler(capacity=2, reserved=0)
+        order = []
+
+        async def request(priority, name):
+            async with scheduler.slot(priority):
+                order.append(name)
+                await asyncio.sleep(0.02)
+
+        tasks = [asyncio.create_task(request(BATCH, f"batch{i}")) for i in range(4)]
+        await asyncio.sleep(0.005)
+        tasks.append(asyncio.create_task(request(BACKFILL, "backfill")))
+        tasks.append(asyncio.create_task(request(INTERACTIVE, "interactive")))
+        await asyncio.gather(*tasks)
+        return order
+
+    order = run(scenario())
+    assert order[:2] == ["batch0", "batch1"]
+    assert order[2] == "interactive"
+    assert order[-1] == "backfill"
+
+
+def test_reserved_slots_are_only_used_by_interactive_work():
+    async def scenario():
+        scheduler = RequestScheduler(capacity=3, reserved=1)
+        for _ in range(2):
+            await scheduler.acquire(BATCH)
+        waiting = asyncio.create_task(scheduler.acquire(BATCH))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        # The reserved slot is still free for an interactive request
+        await asyncio.wait_for(scheduler.acquire(INTERACTIVE), 0.1)
+        metrics = scheduler.metrics()
+        assert metrics[BATCH]['running'] == 2
+        assert metrics[BATCH]['queue_depth'] == 1
+        # Interactive work counts against the batch limit as well
+        scheduler.release(BATCH)
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        scheduler.release(INTERACTIVE)
+        await asyncio.wait_for(waiting, 0.1)
+
+    run(scenario())
+
+
+def test_rate_limit_reserves_a_share_of_the_quota():
+    async def scenario():
+        scheduler = RequestScheduler(capacity=4, reserved=2, requests_per_minute=4)
+        for _ in range(2):
+            async with scheduler.slot(BATCH):
+                pass
+        # Batch may only use half of the per-minute quota
+        with pytest.raises(DeadlineExceeded):
+            async with scheduler.slot(BATCH, Deadline(0.05)):
+                pass
+        async with scheduler.slot(INTERACTIVE, Deadline(0.05)):
+            pass
+        assert scheduler.metrics()[BATCH]['queue_depth'] == 0
+
+    run(scenario())
+
+
+def test_abandoned_waiters_do_not_leak_slots():
+    async def scenario():
+        scheduler = RequestScheduler(capacity=1, reserved=0)
+        await scheduler.acquire(BATCH)
+        with pytest.raises(DeadlineExceeded):
+            async with scheduler.slot(BATCH, Deadline(0.02)):
+                pass
+        scheduler.release(BATCH)
+        await asyncio.wait_for(scheduler.acquire(BATCH), 0.1)
+        return scheduler.metrics()
+
+    metrics = run(scenario())
+    assert metrics[BATCH]['running'] == 1
+    assert metrics[BATCH]['queue_depth'] == 0
+
+
+
+def test_promoted_waiters_use_the_reserved_slots():
+    async def scenario():
+        scheduler = RequestScheduler(capacity=2, reserved=1)
+        await scheduler.acquire(BATCH)
+        ticket = object()
+        waiter = asyncio.ensure_future(scheduler.acquire(BATCH, ticket))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        assert scheduler.promote(ticket, INTERACTIVE)
+        granted = await asyncio.wait_for(waiter, 0.1)
+        assert not scheduler.promote(ticket, INTERACTIVE)
+        scheduler.release(granted)
+        scheduler.release(BATCH)
+        return granted, scheduler.metrics()
+
+    granted, metrics = run(scenario())
+    assert granted == INTERACTIVE
+    assert metrics[INTERACTIVE]['running'] == metrics[BATCH]['running'] == 0
+
+class FakeModel:
+    """Stands in for a Gemini model and records the peak number of concurrent calls"""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.calls = 0
+        self.peak = 0
+
+    async def generate_content_async(self, contents, **kwargs):
+        self.calls += 1
+        running = sum(m['running'] for m in self.scheduler.metrics().values())
+        self.peak = max(self.peak, running)
+        await asyncio.sleep(0.01)
+        return types.SimpleNamespace(text="text")
+
+
+def test_chain_takes_one_slot_per_model_request():
+    scheduler = RequestScheduler(capacity=2, reserved=0)
+    model = FakeModel(scheduler)
+    chain = CaptioningChain(model, model, scheduler)
+    plan = AnalysisPlan.full()
+
+    async def scenario():
+        inputs = [{"image": None, "plan": plan, "priority": BATCH} for _ in range(3)]
+        return await asyncio.gather(*(chain.acall(i) for i in inputs))
+
+    results = run(scenario())
+    assert len(results) == 3
+    assert model.calls == 3 * len(chain.prompts_for(plan))
+    assert model.peak == 2
+    assert scheduler.metrics()[BATCH]['admitted'] == model.calls
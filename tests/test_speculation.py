@@ -0,0 +1,98 @@
+import asyncio
+import time
+import types
+
+from analysis_plan import AnalysisPlan
+from cap_chain import CaptioningChain
+from scheduler import BACKFILL, INTERACTIVE, RequestScheduler
+from speculation import SpeculativeAnalyzer
+
+
+class FakeChain:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.priorities = []
+
+    async def acall(self, inputs):
+        await asyncio.sleep(self.delay)
+        self.priorities.append(inputs["priority"])
+        return {'base_description': "speculated"}
+
+
+def make_analyzer(**kwargs):
+    system = types.SimpleNamespace(chain=FakeChain(), scheduler=RequestScheduler())
+    return SpeculativeAnalyzer(system, **kwargs), system.chain
+
+
+def test_claim_returns_ready_and_in_flight_results():
+    analyzer, chain = make_analyzer()
+    plan = AnalysisPlan.full()
+    assert analyzer.speculate("url:a", None, plan)
+    assert analyzer.claim("url:a", plan, clicked_at=time.monotonic()) == {'base_description': "speculated"}
+    # Claiming promotes the remaining requests of a running speculation
+    assert chain.priorities == [INTERACTIVE]
+    assert analyzer.claim("url:a", plan) == {'base_description': "speculated"}
+    stats = analyzer.stats()
+    assert (stats['attached'], stats['hits'], stats['used']) == (1, 1, 1)
+
+
+def test_speculations_started_after_the_click_are_not_hits():
+    analyzer, _ = make_analyzer()
+    plan = AnalysisPlan.full()
+    clicked_at = time.monotonic()
+    analyzer.speculate("url:a", None, plan)
+    assert analyzer.claim("url:a", plan, clicked_at=clicked_at) is None
+    assert analyzer.stats()['hit_rate'] == 0.0
+
+
+def test_limits_skip_speculation():
+    analyzer, chain = make_analyzer(max_in_flight=1, max_per_minute=2)
+    plan = AnalysisPlan.full()
+    assert analyzer.speculate("url:a", None, plan)
+    assert not analyzer.speculate("url:b", None, plan)
+    time.sleep(0.1)
+    assert analyzer.speculate("url:c", None, plan)
+    time.sleep(0.1)
+    assert not analyzer.speculate("url:d", None, plan)
+    assert analyzer.stats()['skipped'] == 2
+    assert chain.priorities == [BACKFILL, BACKFILL]
+
+
+def test_changed_settings_cancel_the_stale_speculation():
+    analyzer, _ = make_analyzer()
+    analyzer.speculate("url:a", None, AnalysisPlan.from_settings("Standard", []))
+    analyzer.speculate("url:a", None, AnalysisPlan.from_settings("Basic", []))
+    assert analyzer.stats()['wasted'] == 1
+
+
+class SlowModel:
+    async def generate_content_async(self, contents, **kwargs):
+        await asyncio.sleep(0.3)
+        return types.SimpleNamespace(text="text")
+
+
+def test_claim_promotes_a_speculation_queued_as_backfill():
+    # One backfill slot: the second speculation queues behind the first
+    scheduler = RequestScheduler(capacity=2, reserved=1)
+    chain = CaptioningChain(SlowModel(), SlowModel(), scheduler)
+    system = types.SimpleNamespace(chain=chain, scheduler=scheduler)
+    analyzer = SpeculativeAnalyzer(system, max_in_flight=2)
+    plan = AnalysisPlan.from_settings("Basic", [])
+
+    assert analyzer.speculate("url:a", None, plan)
+    time.sleep(0.05)
+    assert analyzer.speculate("url:b", None, plan)
+    time.sleep(0.05)
+    assert scheduler.metrics()[BACKFILL]['queue_depth'] == 1
+
+    # "b" takes the interactive slot instead of waiting for "a" to finish
+    started = time.monotonic()
+    assert analyzer.claim("url:b", plan) is not None
+    assert time.monotonic() - started < 0.45
+    assert analyzer.claim("url:a", plan) is not None
+
+    stats = analyzer.stats()
+    assert (stats['hits'] + stats['attached'], stats['misses'], stats['wasted']) == (2, 0, 0)
+    metrics = scheduler.metrics()
+    assert metrics[INTERACTIVE]['admitted'] == 1
+    assert all(metrics[name]['running'] == 0 for name in metrics)